@@ -6,13 +6,21 @@ Ejecutar: python api/server.py
 
 import os
 import sys
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 from bs4 import BeautifulSoup
 import re
 import requests
 import base64
 from datetime import datetime
+from urllib.parse import urlparse
+
+# idealista_document, rate_control y response_archive son copias de los
+# módulos de la raíz: el despliegue de api/ (Render) solo incluye este directorio
+from idealista_document import IdealistaDocument
+from photo_store import PhotoPersister, create_photo_store, serve_path
+from rate_control import AdaptiveHostController, RetryPolicy, request_with_retry
+from response_archive import mount_adapter, serves_from_archive
 
 # Agregar el directorio raíz al path para importar módulos
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -22,6 +30,28 @@ app = Flask(__name__)
 # Configurar CORS para permitir requests desde el frontend
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=False)
 
+# Sesión compartida para las peticiones a los portales (keep-alive).
+# Con HTTP_ARCHIVE_MODE=record|replay graba o reproduce las respuestas.
+upstream = mount_adapter(
+    requests.Session(),
+    mode=os.environ.get('HTTP_ARCHIVE_MODE', 'off').lower(),
+    directory=os.environ.get('HTTP_ARCHIVE_DIR', 'http_archive'),
+    pool_connections=10,
+    pool_maxsize=10,
+)
+
+# Reintentos ante 429/5xx (pocos y cortos: hay un usuario esperando) y
+# concurrencia por dominio que se reduce si el portal nos frena
+upstream_retry = RetryPolicy(max_retries=2, base_delay=0.5, max_delay=5)
+upstream_controller = AdaptiveHostController(rate=0, max_concurrency=8)
+
+
+def fetch_upstream(url, **kwargs):
+    """GET a un portal con reintentos y control adaptativo por dominio"""
+    # En modo replay no hay red: sin control de ritmo
+    controller = None if serves_from_archive(upstream, url) else upstream_controller
+    return request_with_retry(upstream, 'GET', url, upstream_retry, controller, **kwargs)
+
 
 def download_image_as_base64(image_url):
     """Descarga una imagen y la devuelve como base64"""
@@ -30,7 +60,7 @@ def download_image_as_base64(image_url):
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
             'Referer': 'https://www.idealista.com/',
         }
-        response = requests.get(image_url, headers=headers, timeout=10)
+        response = fetch_upstream(image_url, headers=headers, timeout=10)
         if response.status_code == 200:
             content_type = response.headers.get('content-type', 'image/jpeg')
             b64 = base64.b64encode(response.content).decode('utf-8')
@@ -42,27 +72,28 @@ def download_image_as_base64(image_url):
 
 def parse_idealista_html(html, url='', download_images=True):
     """Parsea el HTML de una página de Idealista"""
-    soup = BeautifulSoup(html, 'html.parser')
-    full_text = soup.get_text()
+    doc = IdealistaDocument(html, 'html.parser')
+    soup = doc.soup
+    full_text = doc.text
 
     def extract_price():
-        el = soup.select_one('span.info-data-price')
+        el = doc.select_one('span.info-data-price')
         if el:
             price_clean = re.sub(r'[^\d]', '', el.text)
             return int(price_clean) if price_clean else 0
         return 0
 
     def extract_title():
-        el = soup.select_one('h1.main-info__title-main, span.main-info__title-main')
+        el = doc.select_one('h1.main-info__title-main, span.main-info__title-main')
         return el.text.strip() if el else ''
 
     def extract_address():
-        el = soup.select_one('span.main-info__title-minor')
+        el = doc.select_one('span.main-info__title-minor')
         return el.text.strip() if el else ''
 
     def extract_zone():
         """Extrae la zona/barrio de la propiedad"""
-        el = soup.select_one('span.main-info__title-minor')
+        el = doc.select_one('span.main-info__title-minor')
         if el:
             text = el.text.strip()
             # Formato típico: "Calle X, Barrio, Ciudad"
@@ -132,19 +163,19 @@ def parse_idealista_html(html, url='', download_images=True):
 
     def extract_parking_included():
         """Comprueba si tiene garaje incluido"""
-        text_lower = full_text.lower()
+        text_lower = doc.text_lower
         has_parking = bool(re.search(r'\b(garaje|parking|plaza de garaje)\b', text_lower))
         is_included = bool(re.search(r'garaje\s*incluido|plaza.*incluida', text_lower))
         return has_parking and is_included
 
     def extract_parking_optional():
         """Comprueba si tiene garaje opcional"""
-        text_lower = full_text.lower()
+        text_lower = doc.text_lower
         return bool(re.search(r'garaje\s*opcional|plaza.*opcional|posibilidad.*garaje', text_lower))
 
     def extract_elevator():
         """Comprueba si tiene ascensor"""
-        text_lower = full_text.lower()
+        text_lower = doc.text_lower
         has_elevator = bool(re.search(r'\bascensor\b', text_lower))
         no_elevator = bool(re.search(r'sin\s*ascensor|no.*ascensor', text_lower))
         return has_elevator and not no_elevator
@@ -169,7 +200,7 @@ def parse_idealista_html(html, url='', download_images=True):
 
     def extract_needs_renovation():
         """Comprueba si necesita reforma"""
-        text_lower = full_text.lower()
+        text_lower = doc.text_lower
         needs = bool(re.search(r'(necesita|para)\s*reforma|a\s*reformar|estado.*reformar', text_lower))
         return needs
 
@@ -337,7 +368,7 @@ def download_photos():
 
     for i, img_url in enumerate(urls[:20]):  # Máximo 20 fotos
         try:
-            response = requests.get(img_url, headers=headers, timeout=10)
+            response = fetch_upstream(img_url, headers=headers, timeout=10)
 
             if response.status_code == 200:
                 content_type = response.headers.get('content-type', 'image/jpeg')
@@ -359,6 +390,87 @@ def download_photos():
     })
 
 
+## Almacén de fotos del servidor (se crea al primer uso)
+_photo_store = None
+
+# Límite de descargas simultáneas al guardar fotos
+PHOTO_STORE_MAX_WORKERS = int(os.environ.get('PHOTO_STORE_MAX_WORKERS', '4'))
+
+
+def get_photo_store():
+    global _photo_store
+    if _photo_store is None:
+        _photo_store = create_photo_store()
+    return _photo_store
+
+
+def image_headers_for_url(url):
+    return {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Referer': get_referer_for_url(url),
+        'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+    }
+
+
+@app.route('/api/persist-photos', methods=['POST'])
+def persist_photos():
+    """
+    Descarga fotos de los portales y las guarda en el almacén del servidor
+    Body: { "urls": ["https://img3.idealista.com/...", ...] }
+    Devuelve: { "photos": [{ "url", "key", "storedUrl" } | { "url", "error" }, ...] }
+    """
+    data = request.get_json(silent=True)
+    urls = data.get('urls') if isinstance(data, dict) else None
+
+    if not urls:
+        return jsonify({'error': 'Se requiere urls'}), 400
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        return jsonify({'error': 'urls debe ser una lista de URLs'}), 400
+
+    store = get_photo_store()
+    if not store.public_base_url:
+        # Sin URL pública las fotos quedarían con direcciones locales (o de un
+        # disco efímero) guardadas para siempre en Firestore
+        return jsonify({
+            'error': 'Almacén de fotos sin URL pública: configura PHOTO_STORE_PUBLIC_URL o PHOTO_STORE_BACKEND=s3'
+        }), 503
+
+    urls = urls[:30]  # Máximo 30 fotos (igual que extract_images)
+    allowed = [url for url in urls if is_allowed_domain(url)]
+
+    persister = PhotoPersister(
+        store,
+        headers_for_url=image_headers_for_url,
+        max_workers=PHOTO_STORE_MAX_WORKERS,
+        fetch=fetch_upstream,
+        # Cada redirección se vuelve a validar (que no lleve a una IP interna)
+        is_allowed=is_allowed_domain,
+    )
+    stored = dict(zip(allowed, persister.persist_many(allowed)))
+
+    photos = [stored.get(url, {'url': url, 'error': 'Domain not allowed'}) for url in urls]
+    ok_count = sum(1 for p in photos if 'key' in p)
+    print(f"📷 Guardadas {ok_count} de {len(urls)} fotos")
+
+    return jsonify({
+        'success': True,
+        'photos': photos
+    })
+
+
+@app.route('/api/photos/<path:key>')
+def stored_photo(key):
+    """Sirve una foto del almacén local del servidor"""
+    location = serve_path(get_photo_store(), key)
+    if not location:
+        return 'Not found', 404
+    directory, filename = location
+    resp = send_from_directory(directory, filename)
+    # El nombre es el hash del contenido: nunca cambia
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resp
+
+
 ## Dominios permitidos para el proxy de imágenes (uno por plataforma)
 ALLOWED_IMAGE_DOMAINS = [
     'idealista.com',
@@ -380,7 +492,15 @@ DOMAIN_REFERERS = {
 }
 
 def is_allowed_domain(url):
-    return any(domain in url for domain in ALLOWED_IMAGE_DOMAINS)
+    """URL http(s) cuyo host es uno de los dominios permitidos o un subdominio suyo"""
+    try:
+        parts = urlparse(url)
+    except ValueError:
+        return False
+    host = (parts.hostname or '').lower()
+    return parts.scheme in ('http', 'https') and any(
+        host == domain or host.endswith('.' + domain) for domain in ALLOWED_IMAGE_DOMAINS
+    )
 
 def get_referer_for_url(url):
     for domain, referer in DOMAIN_REFERERS.items():
@@ -408,7 +528,7 @@ def image_proxy():
 
         # Idealista: si es una URL de página de foto (/inmueble/XXX/foto/N/), extraer la imagen real
         if 'idealista.com' in image_url and '/inmueble/' in image_url and '/foto/' in image_url:
-            response = requests.get(image_url, headers=headers, timeout=10)
+            response = fetch_upstream(image_url, headers=headers, timeout=10)
             if response.status_code == 200:
                 soup = BeautifulSoup(response.text, 'html.parser')
                 # Buscar la imagen principal en la página
@@ -425,7 +545,7 @@ def image_proxy():
                     else:
                         return 'No image found in photo page', 404
 
-        response = requests.get(image_url, headers=headers, timeout=10)
+        response = fetch_upstream(image_url, headers=headers, timeout=10)
 
         if response.status_code == 200:
             from flask import Response
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark del tiempo de extracción por página de los tres parsers de Idealista
+Uso: python bench_extraction.py [pagina1.html pagina2.html ...] [--repeat N] [--archive DIR]
+
+Sin ficheros usa una página de ejemplo sintética. Para medir con páginas
+reales, guarda el HTML de varias fichas (Ctrl+S en el navegador) o usa las
+fichas grabadas con HTTP_ARCHIVE_MODE=record (--archive http_archive).
+"""
+
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'api'))
+
+
+SAMPLE_HTML = """
+<html><body>
+<nav class="breadcrumb-container"><ul>
+  <li>Madrid</li><li>Madrid capital</li><li>Chamberí</li><li>Trafalgar</li>
+</ul></nav>
+<h1 class="main-info__title-main">Piso en venta en calle de Luchana</h1>
+<span class="main-info__title-minor">Trafalgar, Madrid</span>
+<span class="info-data-price">289.000 €</span>
+<div class="info-features">
+  <span>85 m² construidos</span><span>3 habitaciones</span><span>2 baños</span>
+  <span>3ª planta exterior con ascensor</span>
+</div>
+<div class="details-property">
+""" + "\n".join(
+    f'<span class="details-property-feature-text">Característica {i}</span>' for i in range(40)
+) + """
+  <span class="details-property-feature-text">Exterior</span>
+  <span class="details-property-feature-text">Con ascensor</span>
+  <span class="details-property-feature-text">Plaza de garaje incluida en el precio</span>
+</div>
+<div class="comment"><p>""" + "Luminoso piso reformado, orientación sur. " * 60 + """</p></div>
+<picture><img src="https://img4.idealista.com/blur/WEB_DETAIL/0/id.pro.es.image.master/ab/cd/1234567890.jpg"></picture>
+""" + "\n".join(f"<div><span>Texto de relleno {i}</span><li>Elemento {i}</li></div>" for i in range(400)) + """
+</body></html>
+"""
+
+
+def load_pages(paths):
+    if not paths:
+        return [('ejemplo', SAMPLE_HTML)]
+    pages = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def load_archived_pages(directory):
+    """Fichas de inmueble grabadas en el archivo de respuestas"""
+    from response_archive import ResponseArchive
+    archive = ResponseArchive(directory)
+    return [
+        (meta['url'], body.decode('utf-8', errors='replace'))
+        for meta, body in archive.iter_responses(url_contains='/inmueble/')
+    ]
+
+
+def load_extractors():
+    """Devuelve {nombre: función(html, url)} para los parsers disponibles"""
+    extractors = {}
+
+    try:
+        from idealista_scraper import IdealistaScraper
+        scraper = IdealistaScraper()
+        extractors['IdealistaScraper'] = lambda html, url: scraper._parse_property_page(html, url)
+    except ImportError as e:
+        print(f"⚠️  IdealistaScraper no disponible: {e}")
+
+    try:
+        from idealista_playwright import IdealistaPlaywrightScraper
+        playwright_scraper = IdealistaPlaywrightScraper()
+        extractors['IdealistaPlaywrightScraper'] = lambda html, url: playwright_scraper._parse_property_page(html, url)
+    except ImportError as e:
+        print(f"⚠️  IdealistaPlaywrightScraper no disponible: {e}")
+
+    try:
+        from server import parse_idealista_html
+        extractors['api/server.py'] = lambda html, url: parse_idealista_html(html, url)
+    except ImportError as e:
+        print(f"⚠️  api/server.py no disponible: {e}")
+
+    return extractors
+
+
+def bench(extract, pages, repeat):
+    """Tiempos por página en milisegundos"""
+    timings = []
+    url = 'https://www.idealista.com/inmueble/12345678/'
+    for _ in range(repeat):
+        for _, html in pages:
+            start = time.perf_counter()
+            # Los parsers imprimen progreso: no queremos medir la consola
+            with contextlib.redirect_stdout(io.StringIO()):
+                extract(html, url)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    args = sys.argv[1:]
+    repeat = 20
+    if '--repeat' in args:
+        i = args.index('--repeat')
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+
+    archive_dir = None
+    if '--archive' in args:
+        i = args.index('--archive')
+        archive_dir = args[i + 1]
+        del args[i:i + 2]
+
+    pages = load_archived_pages(archive_dir) if archive_dir else load_pages(args)
+    if not pages:
+        print("❌ No hay páginas que medir")
+        return
+    extractors = load_extractors()
+
+    print(f"\n📄 {len(pages)} página(s) × {repeat} repeticiones\n")
+    print(f"{'Parser':<30}{'media':>10}{'p50':>10}{'p95':>10}{'máx':>10}   (ms/página)")
+    print("-" * 75)
+
+    for name, extract in extractors.items():
+        timings = sorted(bench(extract, pages, repeat))
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{name:<30}{statistics.mean(timings):>10.2f}{statistics.median(timings):>10.2f}"
+              f"{p95:>10.2f}{timings[-1]:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -42,5 +42,90 @@ GOOGLE_SHEETS_SPREADSHEET_NAME = os.getenv('GOOGLE_SHEETS_SPREADSHEET_NAME', 'Pi
 # Tracking
 CHECK_INTERVAL_MINUTES = int(os.getenv('CHECK_INTERVAL_MINUTES', '30'))
 
-# Archivo para almacenar IDs de pisos ya vistos
+# Base de datos de pisos ya vistos (SQLite, compartida entre trackers)
+PROPERTY_STORE_FILE = os.getenv('PROPERTY_STORE_FILE', 'properties.db')
+
+# Fichero JSON antiguo de pisos vistos: se importa a PROPERTY_STORE_FILE al arrancar
 SEEN_PROPERTIES_FILE = 'seen_properties.json'
+
+# Scraping: límite de peticiones por dominio y peticiones simultáneas
+SCRAPER_REQUESTS_PER_SECOND = float(os.getenv('SCRAPER_REQUESTS_PER_SECOND', '0.5'))
+SCRAPER_BURST = int(os.getenv('SCRAPER_BURST', '2'))
+SCRAPER_MAX_CONCURRENCY = int(os.getenv('SCRAPER_MAX_CONCURRENCY', '4'))
+SCRAPER_MAX_SEARCH_PAGES = int(os.getenv('SCRAPER_MAX_SEARCH_PAGES', '10'))
+
+# Estado de las búsquedas sondeadas (ETag / Last-Modified / hash de resultados)
+POLL_STATE_FILE = os.getenv('POLL_STATE_FILE', 'poll_state.json')
+
+# Playwright: páginas simultáneas y usos de cada contexto antes de reciclarlo
+PLAYWRIGHT_MAX_CONCURRENCY = int(os.getenv('PLAYWRIGHT_MAX_CONCURRENCY', '4'))
+PLAYWRIGHT_RECYCLE_AFTER = int(os.getenv('PLAYWRIGHT_RECYCLE_AFTER', '50'))
+PLAYWRIGHT_READY_TIMEOUT_MS = int(os.getenv('PLAYWRIGHT_READY_TIMEOUT_MS', '5000'))
+
+# Archivo local de respuestas HTTP: off, record (grabar) o replay (reproducir sin red)
+HTTP_ARCHIVE_MODE = os.getenv('HTTP_ARCHIVE_MODE', 'off').lower()
+HTTP_ARCHIVE_DIR = os.getenv('HTTP_ARCHIVE_DIR', 'http_archive')
+
+# Reintentos HTTP (backoff exponencial con jitter, respeta Retry-After)
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+HTTP_RETRY_BASE_DELAY = float(os.getenv('HTTP_RETRY_BASE_DELAY', '1'))
+HTTP_RETRY_MAX_DELAY = float(os.getenv('HTTP_RETRY_MAX_DELAY', '60'))
+
+# Ritmo máximo al que puede subir el scraper tras una racha de éxitos
+SCRAPER_MAX_REQUESTS_PER_SECOND = float(os.getenv('SCRAPER_MAX_REQUESTS_PER_SECOND', str(SCRAPER_REQUESTS_PER_SECOND)))
+
+# Peticiones simultáneas por dominio a las APIs (se reduce solo ante throttling)
+API_MAX_CONCURRENCY = int(os.getenv('API_MAX_CONCURRENCY', '4'))
+
+# Tiempo máximo por ciclo para completar los detalles de las propiedades nuevas
+ENRICH_TIME_BUDGET_SECONDS = float(os.getenv('ENRICH_TIME_BUDGET_SECONDS', '60'))
+
+# RapidAPI: peticiones simultáneas (páginas de search_all_pages)
+RAPIDAPI_MAX_CONCURRENCY = int(os.getenv('RAPIDAPI_MAX_CONCURRENCY', '4'))
+
+# Caché de respuestas de RapidAPI (segundos de validez y de stale-while-revalidate)
+RAPIDAPI_CACHE_ENABLED = os.getenv('RAPIDAPI_CACHE_ENABLED', 'true').lower() == 'true'
+RAPIDAPI_CACHE_FILE = os.getenv('RAPIDAPI_CACHE_FILE', 'rapidapi_cache.db')
+RAPIDAPI_CACHE_TTL_LISTHOMES = int(os.getenv('RAPIDAPI_CACHE_TTL_LISTHOMES', '600'))
+RAPIDAPI_CACHE_STALE_LISTHOMES = int(os.getenv('RAPIDAPI_CACHE_STALE_LISTHOMES', '300'))
+RAPIDAPI_CACHE_TTL_PROPERTY = int(os.getenv('RAPIDAPI_CACHE_TTL_PROPERTY', '604800'))
+RAPIDAPI_CACHE_STALE_PROPERTY = int(os.getenv('RAPIDAPI_CACHE_STALE_PROPERTY', '86400'))
+
+# Presupuesto de cuota de RapidAPI: el intervalo de sondeo se ajusta a las
+# llamadas restantes del periodo (entre el mínimo y el máximo en segundos)
+RAPIDAPI_QUOTA_FILE = os.getenv('RAPIDAPI_QUOTA_FILE', 'rapidapi_quota.json')
+RAPIDAPI_QUOTA_PERIOD_DAYS = int(os.getenv('RAPIDAPI_QUOTA_PERIOD_DAYS', '30'))
+RAPIDAPI_QUOTA_RESERVE_SHARE = float(os.getenv('RAPIDAPI_QUOTA_RESERVE_SHARE', '0.25'))
+RAPIDAPI_MIN_POLL_SECONDS = int(os.getenv('RAPIDAPI_MIN_POLL_SECONDS', '300'))
+RAPIDAPI_MAX_POLL_SECONDS = int(os.getenv('RAPIDAPI_MAX_POLL_SECONDS', '86400'))
+
+# API oficial: páginas máximas por búsqueda (50 anuncios cada una)
+IDEALISTA_API_MAX_PAGES = int(os.getenv('IDEALISTA_API_MAX_PAGES', '20'))
+
+# Token OAuth de la API oficial compartido entre procesos (se renueva
+# REFRESH_MARGIN segundos antes de caducar)
+IDEALISTA_TOKEN_FILE = os.getenv('IDEALISTA_TOKEN_FILE', '.idealista_token.json')
+IDEALISTA_TOKEN_REFRESH_MARGIN = int(os.getenv('IDEALISTA_TOKEN_REFRESH_MARGIN', '300'))
+
+# Varias búsquedas desde un solo proceso (multi_tracker.py)
+SEARCHES_FILE = os.getenv('SEARCHES_FILE', 'searches.json')
+MULTI_SEARCH_MAX_CONCURRENCY = int(os.getenv('MULTI_SEARCH_MAX_CONCURRENCY', '4'))
+
+# API oficial: divisiones máximas de la zona en el barrido por teselas
+IDEALISTA_SWEEP_MAX_DEPTH = int(os.getenv('IDEALISTA_SWEEP_MAX_DEPTH', '5'))
+
+# Pisos vistos: días sin aparecer para volver a contar como nuevos (0 = nunca)
+SEEN_TTL_DAYS = int(os.getenv('SEEN_TTL_DAYS', '0'))
+
+# Google Sheets: filas por llamada al añadir propiedades en bloque
+SHEETS_APPEND_CHUNK_SIZE = int(os.getenv('SHEETS_APPEND_CHUNK_SIZE', '500'))
+
+# Google Sheets: segundos de validez del índice local ID → fila
+SHEETS_INDEX_TTL_SECONDS = int(os.getenv('SHEETS_INDEX_TTL_SECONDS', '3600'))
+
+# Google Sheets: cola persistente de escrituras en segundo plano
+# (segundos entre escrituras, pendientes que fuerzan una escritura, cuota por minuto)
+SHEETS_QUEUE_FILE = os.getenv('SHEETS_QUEUE_FILE', 'sheets_queue.db')
+SHEETS_FLUSH_INTERVAL_SECONDS = float(os.getenv('SHEETS_FLUSH_INTERVAL_SECONDS', '30'))
+SHEETS_FLUSH_BATCH_SIZE = int(os.getenv('SHEETS_FLUSH_BATCH_SIZE', '50'))
+SHEETS_WRITES_PER_MINUTE = int(os.getenv('SHEETS_WRITES_PER_MINUTE', '50'))
@@ -0,0 +1,81 @@
+"""
+Teselado geográfico para búsquedas por centro + radio
+La API devuelve como mucho unas cuantas páginas por consulta: si una zona
+tiene más anuncios, se divide su rectángulo en cuatro cuadrantes y cada uno
+se consulta como un círculo que lo contiene, hasta que todos caben. Los
+cuadrantes que quedan fuera del círculo de búsqueda no se consultan.
+"""
+
+import math
+
+
+METERS_PER_DEGREE_LAT = 111_320
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distancia en metros entre dos puntos"""
+    r = 6_371_000
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * r * math.asin(math.sqrt(a))
+
+
+def parse_center(center):
+    """'40.41,-3.70' → (40.41, -3.70)"""
+    lat, lon = (float(v) for v in str(center).split(','))
+    return lat, lon
+
+
+class Tile:
+    """Rectángulo lat/lon de la zona de búsqueda"""
+
+    def __init__(self, min_lat, min_lon, max_lat, max_lon, depth=0):
+        self.min_lat = min_lat
+        self.min_lon = min_lon
+        self.max_lat = max_lat
+        self.max_lon = max_lon
+        self.depth = depth
+
+    @classmethod
+    def around(cls, lat, lon, distance):
+        """Rectángulo que contiene el círculo de `distance` metros alrededor del centro"""
+        dlat = distance / METERS_PER_DEGREE_LAT
+        dlon = distance / (METERS_PER_DEGREE_LAT * math.cos(math.radians(lat)))
+        return cls(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+    @property
+    def center(self):
+        return (self.min_lat + self.max_lat) / 2, (self.min_lon + self.max_lon) / 2
+
+    @property
+    def radius(self):
+        """Radio (m) del círculo que contiene el rectángulo entero"""
+        lat, lon = self.center
+        return math.ceil(haversine_m(lat, lon, self.max_lat, self.max_lon))
+
+    def query(self):
+        """Parámetros center/distance de la API para este rectángulo"""
+        lat, lon = self.center
+        return {'center': f"{lat:.6f},{lon:.6f}", 'distance': self.radius}
+
+    def split(self):
+        """Los cuatro cuadrantes del rectángulo"""
+        lat, lon = self.center
+        depth = self.depth + 1
+        return [
+            Tile(self.min_lat, self.min_lon, lat, lon, depth),
+            Tile(self.min_lat, lon, lat, self.max_lon, depth),
+            Tile(lat, self.min_lon, self.max_lat, lon, depth),
+            Tile(lat, lon, self.max_lat, self.max_lon, depth),
+        ]
+
+    def contains(self, lat, lon):
+        return self.min_lat <= lat <= self.max_lat and self.min_lon <= lon <= self.max_lon
+
+    def distance_to(self, lat, lon):
+        """Distancia (m) del punto al rectángulo (0 si está dentro)"""
+        nearest_lat = min(max(lat, self.min_lat), self.max_lat)
+        nearest_lon = min(max(lon, self.min_lon), self.max_lon)
+        return haversine_m(lat, lon, nearest_lat, nearest_lon)
@@ -1,3 +1,5 @@
+import re
+import time
 import gspread
 from google.oauth2.service_account import Credentials
 from datetime import datetime
@@ -13,6 +15,9 @@ class GoogleSheetsManager:
         self.client = None
         self.spreadsheet = None
         self.worksheet = None
+        # Índice local ID → nº de fila (columna A), para no buscar en la hoja
+        self._row_index = None
+        self._row_index_loaded_at = 0
         self._authenticate()
         
     def _authenticate(self):
@@ -94,69 +99,168 @@ class GoogleSheetsManager:
         
         print("✅ Encabezados configurados")
     
-    def property_exists(self, property_id):
-        """Verifica si una propiedad ya existe en la hoja"""
+    def _rows(self, force=False):
+        """
+        Índice ID → fila. Se carga leyendo la columna A una sola vez y se
+        mantiene al añadir filas; se vuelve a leer si se pide o si tiene más
+        de config.SHEETS_INDEX_TTL_SECONDS (por si alguien edita la hoja a mano).
+        """
+        expired = time.time() - self._row_index_loaded_at > config.SHEETS_INDEX_TTL_SECONDS
+        if force or self._row_index is None or expired:
+            ids = self.worksheet.col_values(1)
+            # Fila 1 = encabezados; las filas empiezan en 1
+            self._row_index = {str(pid): row for row, pid in enumerate(ids, 1) if row > 1 and pid}
+            self._row_index_loaded_at = time.time()
+        return self._row_index
+    
+    def refresh_row_index(self):
+        """Vuelve a leer la columna de IDs de la hoja"""
+        return len(self._rows(force=True))
+    
+    def _index_appended_rows(self, response, properties):
+        """Añade al índice las filas recién escritas según el rango que devuelve la API"""
+        if self._row_index is None:
+            return
+        updated_range = (response or {}).get('updates', {}).get('updatedRange', '')
+        match = re.search(r'![A-Z]+(\d+)', updated_range)
+        if not match:
+            # Sin rango no sabemos en qué filas han quedado: recargar la próxima vez
+            self._row_index = None
+            return
+        first_row = int(match.group(1))
+        for offset, property_data in enumerate(properties):
+            self._row_index[str(property_data.get('id', ''))] = first_row + offset
+    
+    def property_exists(self, property_id, raise_errors=False):
+        """
+        Verifica si una propiedad ya existe en la hoja (sin llamar a la API
+        salvo para cargar el índice).
+        
+        Args:
+            property_id: ID de la propiedad
+            raise_errors: Relanzar el error si no se puede leer la hoja, en lugar
+                          de devolver False (quien escribe filas no debe
+                          tomar un fallo de lectura por "no existe")
+        """
         try:
-            cell = self.worksheet.find(str(property_id))
-            return cell is not None
-        except gspread.exceptions.CellNotFound:
+            return str(property_id) in self._rows()
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"❌ Error leyendo IDs de la hoja: {e}")
             return False
     
+    def _build_row(self, property_data):
+        """Fila de la hoja (columnas A-T) para una propiedad"""
+        return [
+            property_data.get('id', ''),
+            property_data.get('titulo', ''),
+            property_data.get('precio', 0),
+            property_data.get('tamaño', 0),
+            property_data.get('precio_m2', 0),
+            property_data.get('habitaciones', 0),
+            property_data.get('baños', 0),
+            property_data.get('planta', 'N/A'),
+            'Sí' if property_data.get('exterior') else 'No',
+            'Sí' if property_data.get('ascensor') else 'No',
+            'Sí' if property_data.get('parking') else 'No',
+            property_data.get('direccion', ''),
+            property_data.get('distrito', ''),
+            property_data.get('municipio', ''),
+            property_data.get('provincia', ''),
+            property_data.get('url', ''),
+            property_data.get('thumbnail', ''),
+            (property_data.get('descripcion') or '')[:500],  # Limitar descripción
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'Nuevo'
+        ]
+    
     def add_property(self, property_data):
         """Añade una nueva propiedad a la hoja"""
-        try:
-            row = [
-                property_data.get('id', ''),
-                property_data.get('titulo', ''),
-                property_data.get('precio', 0),
-                property_data.get('tamaño', 0),
-                property_data.get('precio_m2', 0),
-                property_data.get('habitaciones', 0),
-                property_data.get('baños', 0),
-                property_data.get('planta', 'N/A'),
-                'Sí' if property_data.get('exterior') else 'No',
-                'Sí' if property_data.get('ascensor') else 'No',
-                'Sí' if property_data.get('parking') else 'No',
-                property_data.get('direccion', ''),
-                property_data.get('distrito', ''),
-                property_data.get('municipio', ''),
-                property_data.get('provincia', ''),
-                property_data.get('url', ''),
-                property_data.get('thumbnail', ''),
-                property_data.get('descripcion', '')[:500],  # Limitar descripción
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'Nuevo'
-            ]
-            
-            self.worksheet.append_row(row)
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error añadiendo propiedad {property_data.get('id')}: {e}")
-            return False
+        return self.add_properties([property_data]) == 1
+    
+    def add_properties(self, properties, chunk_size=None, raise_errors=False):
+        """
+        Añade varias propiedades con una sola llamada append_rows por bloque
+        (en lugar de una llamada por fila).
+        
+        Args:
+            properties: Propiedades formateadas
+            chunk_size: Filas por llamada (default: config.SHEETS_APPEND_CHUNK_SIZE)
+            raise_errors: Relanzar el error de la API en lugar de devolver las añadidas
+        
+        Returns:
+            int: Propiedades añadidas. Los bloques se escriben en orden, así
+                 que son las primeras de la lista
+        """
+        chunk_size = chunk_size or config.SHEETS_APPEND_CHUNK_SIZE
+        properties = list(properties)
+        added = 0
+        
+        for start in range(0, len(properties), chunk_size):
+            chunk = properties[start:start + chunk_size]
+            try:
+                response = self.worksheet.append_rows([self._build_row(p) for p in chunk])
+                self._index_appended_rows(response, chunk)
+                added += len(chunk)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                ids = ', '.join(str(p.get('id')) for p in chunk[:5])
+                print(f"❌ Error añadiendo {len(chunk)} propiedad(es) ({ids}...): {e}")
+                break
+        
+        return added
     
     def get_all_property_ids(self):
         """Obtiene todos los IDs de propiedades existentes"""
         try:
-            # Obtener columna A (IDs) excluyendo el encabezado
-            ids = self.worksheet.col_values(1)[1:]
-            return set(ids)
+            # Leer de nuevo la columna A (IDs) y refrescar el índice
+            return set(self._rows(force=True))
         except Exception as e:
             print(f"❌ Error obteniendo IDs: {e}")
             return set()
     
     def update_property_status(self, property_id, status):
         """Actualiza el estado de una propiedad"""
+        return self.update_statuses({property_id: status}) == 1
+    
+    def update_statuses(self, statuses, raise_errors=False):
+        """
+        Actualiza el estado de varias propiedades con una sola llamada batch_update.
+        
+        Args:
+            statuses: {id: estado}, p. ej. {'108542671': 'Visitado'}
+            raise_errors: Relanzar el error de la API en lugar de devolver 0
+        
+        Returns:
+            int: Propiedades actualizadas (las que no están en la hoja se ignoran)
+        """
+        if not statuses:
+            return 0
         try:
-            cell = self.worksheet.find(str(property_id))
-            if cell:
-                # Actualizar la columna de estado (columna T = 20)
-                self.worksheet.update_cell(cell.row, 20, status)
-                return True
-            return False
+            rows = self._rows()
+            if any(str(pid) not in rows for pid in statuses):
+                # Puede haberse añadido desde otro proceso: refrescar una vez
+                rows = self._rows(force=True)
+            
+            # Columna de estado: T (20)
+            updates = [
+                {'range': f"T{rows[str(pid)]}", 'values': [[status]]}
+                for pid, status in statuses.items() if str(pid) in rows
+            ]
+            missing = [str(pid) for pid in statuses if str(pid) not in rows]
+            if missing:
+                print(f"⚠️  {len(missing)} propiedad(es) no están en la hoja: {', '.join(missing[:5])}")
+            
+            if updates:
+                self.worksheet.batch_update(updates)
+            return len(updates)
         except Exception as e:
-            print(f"❌ Error actualizando estado: {e}")
-            return False
+            if raise_errors:
+                raise
+            print(f"❌ Error actualizando estados: {e}")
+            return 0
     
     def get_spreadsheet_url(self):
         """Obtiene la URL de la hoja de cálculo"""
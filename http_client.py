@@ -0,0 +1,225 @@
+"""
+Motor de peticiones HTTP compartido por los scrapers y clientes de API
+Limita la velocidad por dominio (token bucket adaptativo), el número de
+peticiones simultáneas y reintenta con backoff ante 429/5xx, para aprovechar
+el ritmo permitido sin saturar el servidor.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import config
+from rate_control import AdaptiveHostController, RetryPolicy, request_with_retry
+from response_archive import mount_adapter, serves_from_archive
+
+
+def mount_pooled_adapter(session, pool_size=10):
+    """
+    Monta en la sesión un adaptador keep-alive con `pool_size` conexiones por
+    dominio, que graba o reproduce respuestas según config.HTTP_ARCHIVE_MODE
+    """
+    return mount_adapter(
+        session,
+        mode=config.HTTP_ARCHIVE_MODE,
+        directory=config.HTTP_ARCHIVE_DIR,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
+
+
+def create_session(pool_size=10):
+    """Sesión requests con pool de conexiones (y archivo de respuestas si está activo)"""
+    return mount_pooled_adapter(requests.Session(), pool_size)
+
+
+def default_retry_policy():
+    return RetryPolicy(
+        max_retries=config.HTTP_MAX_RETRIES,
+        base_delay=config.HTTP_RETRY_BASE_DELAY,
+        max_delay=config.HTTP_RETRY_MAX_DELAY,
+    )
+
+
+# Control compartido para las APIs (sin ritmo fijo: solo se frena ante throttling)
+api_controller = AdaptiveHostController(rate=0, max_concurrency=config.API_MAX_CONCURRENCY)
+
+
+def _controller_for(session, url, controller):
+    # Las respuestas reproducidas del archivo no tocan la red: sin límite de ritmo
+    return None if serves_from_archive(session, url) else controller
+
+
+def api_request(session, method, url, **kwargs):
+    """Petición a una API con reintentos y control adaptativo por dominio"""
+    controller = _controller_for(session, url, api_controller)
+    return request_with_retry(session, method, url, default_retry_policy(), controller, **kwargs)
+
+
+class FetchEngine:
+    """
+    Ejecuta peticiones sobre una sesión compartida respetando el límite por
+    dominio y un máximo de peticiones simultáneas.
+    """
+
+    def __init__(self, session, rate=None, burst=None, max_concurrency=None):
+        self.session = session
+        self.max_concurrency = max_concurrency or config.SCRAPER_MAX_CONCURRENCY
+        rate = rate if rate is not None else config.SCRAPER_REQUESTS_PER_SECOND
+        self.controller = AdaptiveHostController(
+            rate=rate,
+            burst=burst if burst is not None else config.SCRAPER_BURST,
+            max_concurrency=self.max_concurrency,
+            max_rate=max(rate, config.SCRAPER_MAX_REQUESTS_PER_SECOND),
+        )
+        self.retry_policy = default_retry_policy()
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+        # Un pool de conexiones keep-alive por cada petición simultánea
+        mount_pooled_adapter(self.session, self.max_concurrency)
+
+    def get(self, url, **kwargs):
+        """GET limitado por dominio y por concurrencia, con reintentos"""
+        controller = _controller_for(self.session, url, self.controller)
+        with self._slots:
+            return request_with_retry(self.session, 'GET', url, self.retry_policy, controller, **kwargs)
+
+    def get_if_modified(self, url, poll_state, **kwargs):
+        """
+        GET condicional con los validadores guardados (ETag / Last-Modified).
+        Devuelve None si el servidor responde 304 (sin cambios).
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(poll_state.conditional_headers(url))
+
+        response = self.get(url, headers=headers, **kwargs)
+        if response.status_code == 304:
+            return None
+
+        # Los validadores de una página de error no describen los resultados
+        if 200 <= response.status_code < 300:
+            poll_state.update_validators(url, response)
+        return response
+
+    def map(self, func, items):
+        """Aplica `func` a cada elemento en paralelo y devuelve los resultados en orden"""
+        items = list(items)
+        if len(items) <= 1:
+            return [func(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(func, items))
+
+
+def listing_fingerprint(items):
+    """Hash estable de una lista de resultados ya normalizada"""
+    payload = json.dumps(items, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class PollStateStore:
+    """
+    Estado de las búsquedas sondeadas periódicamente: validadores HTTP
+    (ETag / Last-Modified), hash del bloque de resultados y cursor por búsqueda.
+
+    Los ciclos de sondeo trabajan sobre begin(): los validadores, hashes y
+    cursores nuevos solo pasan al estado con commit(), una vez procesados los
+    resultados. Si el ciclo falla, la próxima consulta vuelve a traerlos.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.POLL_STATE_FILE
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"⚠️  Error cargando estado de búsquedas: {e}")
+        return {}
+
+    def save(self):
+        """Guarda el estado en disco"""
+        with self._lock:
+            try:
+                # Escritura atómica: un corte a mitad no deja el fichero truncado
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._state, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"❌ Error guardando estado de búsquedas: {e}")
+
+    def begin(self):
+        """Cambios de un ciclo de sondeo, pendientes hasta commit()"""
+        return PollStateTransaction(self)
+
+    def _entry(self, key):
+        return self._state.get(key, {})
+
+    def _update(self, key, **fields):
+        with self._lock:
+            self._state.setdefault(key, {}).update(fields)
+
+    def conditional_headers(self, key):
+        entry = self._entry(key)
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def update_validators(self, key, response):
+        self._update(key, etag=response.headers.get('ETag'),
+                     last_modified=response.headers.get('Last-Modified'))
+
+    def is_unchanged(self, key, content_hash):
+        """Compara el hash con el anterior y guarda el nuevo. True si no ha cambiado"""
+        unchanged = self._entry(key).get('content_hash') == content_hash
+        self._update(key, content_hash=content_hash, checked_at=datetime.now().isoformat())
+        return unchanged
+
+    def get_cursor(self, key):
+        """Cursor incremental guardado para una búsqueda (o None)"""
+        return self._entry(key).get('cursor')
+
+    def set_cursor(self, key, cursor):
+        self._update(key, cursor=cursor)
+
+
+class PollStateTransaction(PollStateStore):
+    """
+    Vista de un PollStateStore para un ciclo de sondeo: lee el estado
+    guardado más los cambios propios, que no se aplican hasta commit()
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.path = store.path
+        self._lock = threading.Lock()
+        self._changes = {}
+
+    def _entry(self, key):
+        with self._lock:
+            changes = dict(self._changes.get(key, {}))
+        return {**self.store._entry(key), **changes}
+
+    def _update(self, key, **fields):
+        with self._lock:
+            self._changes.setdefault(key, {}).update(fields)
+
+    def commit(self):
+        """Aplica los cambios al estado (el llamador hace store.save())"""
+        with self._lock:
+            changes, self._changes = self._changes, {}
+        for key, fields in changes.items():
+            self.store._update(key, **fields)
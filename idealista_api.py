@@ -1,7 +1,18 @@
 import requests
 import base64
-from datetime import datetime, timedelta
+import hashlib
+from datetime import datetime
 import config
+from http_client import api_request, create_session, listing_fingerprint
+from token_store import TokenStore
+from geo_tiling import Tile, haversine_m, parse_center
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Máximo de resultados por página que admite la API
+MAX_ITEMS_PER_PAGE = 50
+# Códigos más recientes que se guardan en el cursor para detectar el corte
+CURSOR_SIZE = 20
 
 
 class IdealistaAPI:
@@ -13,12 +24,27 @@ class IdealistaAPI:
         self.base_url = "https://api.idealista.com"
         self.access_token = None
         self.token_expiry = None
+        # Sesión keep-alive compartida por el token y las búsquedas
+        self.session = create_session(pool_size=config.API_MAX_CONCURRENCY)
+        # Token OAuth compartido con otros procesos (cron, verify.py, workers)
+        self.token_store = TokenStore(config.IDEALISTA_TOKEN_FILE, config.IDEALISTA_TOKEN_REFRESH_MARGIN)
         
     def _get_access_token(self):
-        """Obtiene el token de acceso OAuth2"""
+        """Obtiene el token de acceso OAuth2 (compartido entre procesos)"""
         if self.access_token and self.token_expiry and datetime.now() < self.token_expiry:
             return self.access_token
-            
+
+        self.access_token, expires_at = self.token_store.get(self._token_key(), self._request_access_token)
+        # Renovar antes de que caduque, igual que el almacén compartido
+        self.token_expiry = datetime.fromtimestamp(expires_at - self.token_store.refresh_margin)
+        return self.access_token
+
+    def _token_key(self):
+        """Clave del token en el almacén: hash de la API key (nunca la key en claro)"""
+        return hashlib.sha256(f"{self.base_url}|{self.api_key}".encode()).hexdigest()[:16]
+
+    def _request_access_token(self):
+        """Pide un token nuevo al endpoint OAuth2. Devuelve (token, segundos de validez)"""
         url = f"{self.base_url}/oauth/token"
         
         # Crear credenciales en formato base64
@@ -36,32 +62,27 @@ class IdealistaAPI:
         }
         
         try:
-            response = requests.post(url, headers=headers, data=data)
+            response = api_request(self.session, 'POST', url, headers=headers, data=data)
             response.raise_for_status()
             
             token_data = response.json()
-            self.access_token = token_data['access_token']
             # El token expira en 1 hora (3600 segundos)
-            self.token_expiry = datetime.now() + timedelta(seconds=token_data.get('expires_in', 3600))
-            
-            return self.access_token
+            return token_data['access_token'], token_data.get('expires_in', 3600)
             
         except requests.exceptions.RequestException as e:
             print(f"❌ Error obteniendo token de acceso: {e}")
             raise
     
-    def search_properties(self):
-        """Busca propiedades según los criterios configurados"""
-        token = self._get_access_token()
-        
-        url = f"{self.base_url}/3.5/{config.IDEALISTA_COUNTRY}/search"
-        
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
-        
-        # Parámetros de búsqueda
+    def search_properties(self, **overrides):
+        """
+        Busca propiedades según los criterios configurados (primera página).
+        `overrides` sustituye parámetros de la API (center, distance, minPrice...)
+        """
+        data = self._search_page(1, **overrides)
+        return data.get('elementList', [])
+
+    def _search_params(self, num_page, **overrides):
+        """Parámetros de búsqueda, de más reciente a más antigua"""
         params = {
             'center': config.CENTER,
             'country': config.IDEALISTA_COUNTRY,
@@ -73,24 +94,252 @@ class IdealistaAPI:
             'minPrice': config.MIN_PRICE,
             'minSize': config.MIN_SIZE,
             'maxSize': config.MAX_SIZE,
-            'maxItems': 50,
-            'numPage': 1,
+            'maxItems': MAX_ITEMS_PER_PAGE,
+            'numPage': num_page,
             'order': 'publicationDate',  # Ordenar por fecha de publicación
+            'sort': 'desc',
         }
-        
+        params.update({key: value for key, value in overrides.items() if value is not None})
+        return params
+
+    def _search_page(self, num_page, **overrides):
+        """Pide una página de resultados y devuelve la respuesta completa"""
+        token = self._get_access_token()
+
+        url = f"{self.base_url}/3.5/{config.IDEALISTA_COUNTRY}/search"
+
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+
         try:
-            response = requests.post(url, headers=headers, data=params)
+            response = api_request(self.session, 'POST', url, headers=headers,
+                                   data=self._search_params(num_page, **overrides))
+            if response.status_code == 401:
+                # Token revocado o caducado antes de tiempo: pedir otro una vez
+                self.token_store.invalidate(self._token_key())
+                self.access_token = None
+                headers['Authorization'] = f'Bearer {self._get_access_token()}'
+                response = api_request(self.session, 'POST', url, headers=headers,
+                                       data=self._search_params(num_page, **overrides))
             response.raise_for_status()
-            
-            data = response.json()
-            return data.get('elementList', [])
-            
+            return response.json()
+
         except requests.exceptions.RequestException as e:
             print(f"❌ Error buscando propiedades: {e}")
             if hasattr(e.response, 'text'):
                 print(f"Respuesta: {e.response.text}")
             raise
-    
+
+    def _search_key(self, **overrides):
+        """Clave de la búsqueda (para el cursor guardado)"""
+        p = self._search_params(1, **overrides)
+        return (f"{self.base_url}/search?center={p['center']}&distance={p['distance']}"
+                f"&operation={p['operation']}&propertyType={p['propertyType']}"
+                f"&price={p['minPrice']}-{p['maxPrice']}&size={p['minSize']}-{p['maxSize']}")
+
+    def search_new_properties(self, poll_state, max_pages=None, **overrides):
+        """
+        Recorre las páginas de la búsqueda (más recientes primero) hasta
+        llegar a un anuncio ya visto en la consulta anterior.
+
+        El cursor guardado en poll_state tiene los códigos más recientes
+        vistos; sin cursor (primera ejecución) se recorren todas las páginas
+        hasta `max_pages`.
+
+        Returns:
+            list: Propiedades nuevas desde la última consulta, de más reciente a más antigua
+        """
+        return self._walk_new_pages(poll_state, max_pages, **overrides)[0]
+
+    def _walk_new_pages(self, poll_state, max_pages=None, **overrides):
+        """
+        Recorrido de search_new_properties. Devuelve (nuevas, recorridas,
+        página 1): las recorridas son todos los anuncios de las páginas
+        consultadas, incluidos los ya conocidos de la página del corte.
+        """
+        max_pages = max_pages or config.IDEALISTA_API_MAX_PAGES
+        search_key = self._search_key(**overrides)
+        cursor = poll_state.get_cursor(search_key) or {}
+        known_codes = set(cursor.get('recent_codes', []))
+
+        new_properties = []
+        visited = []
+        first_page = []
+        reached_known = False
+        pages_fetched = 0
+        total_pages = 1
+
+        while pages_fetched < min(max_pages, total_pages):
+            pages_fetched += 1
+            data = self._search_page(pages_fetched, **overrides)
+            elements = data.get('elementList', [])
+            total_pages = data.get('totalPages', 1) or 1
+            if pages_fetched == 1:
+                first_page = elements
+
+            # La página del corte se lee entera: sus anuncios conocidos
+            # también sirven para seguir cambios de precio
+            visited.extend(elements)
+            for prop in elements:
+                if reached_known:
+                    break
+                if str(prop.get('propertyCode')) in known_codes:
+                    reached_known = True
+                else:
+                    new_properties.append(prop)
+
+            if reached_known or not elements:
+                break
+
+        print(f"📄 {pages_fetched} página(s) consultada(s)"
+              + (" (alcanzado el último anuncio conocido)" if reached_known else ""))
+
+        if new_properties:
+            # Los nuevos códigos van delante de los anteriores: si el más
+            # reciente desaparece, los siguientes siguen marcando el corte
+            recent_codes = [str(p.get('propertyCode')) for p in new_properties[:CURSOR_SIZE]]
+            recent_codes += [c for c in cursor.get('recent_codes', []) if c not in recent_codes]
+            poll_state.set_cursor(search_key, {
+                'recent_codes': recent_codes[:CURSOR_SIZE],
+                'newest_code': recent_codes[0],
+                'newest_date': new_properties[0].get('publicationDate') or datetime.now().isoformat(),
+            })
+
+        return new_properties, visited, first_page
+
+    @staticmethod
+    def _page_fingerprint(elements):
+        """Hash de códigos y precios de una página de resultados"""
+        return listing_fingerprint([[p.get('propertyCode'), p.get('price')] for p in elements])
+
+    def sweep_area(self, center=None, distance=None, max_pages=None, max_depth=None,
+                   max_concurrency=None, first_page=None, **overrides):
+        """
+        Recorre una zona completa aunque tenga más anuncios de los que la API
+        devuelve en una sola búsqueda.
+
+        Primero se consulta el propio círculo de búsqueda: si su total cabe
+        en `max_pages` páginas se piden las demás y no hace falta teselar.
+        Si no, su rectángulo se divide en cuadrantes, y cada tesela se
+        consulta con su página 1 y se vuelve a dividir mientras no quepa.
+        Las teselas que no tocan el círculo se descartan sin consultarlas.
+        Las de cada nivel se consultan en paralelo y los resultados se
+        deduplican por propertyCode.
+
+        Args:
+            center: 'lat,lon' (default: config.CENTER)
+            distance: Radio en metros (default: config.DISTANCE)
+            max_pages: Páginas máximas por tesela (default: config.IDEALISTA_API_MAX_PAGES)
+            max_depth: Divisiones máximas (default: config.IDEALISTA_SWEEP_MAX_DEPTH)
+            max_concurrency: Peticiones simultáneas (default: config.API_MAX_CONCURRENCY)
+            first_page: Respuesta ya pedida de la página 1 del círculo (sweep_area_if_changed)
+            **overrides: Resto de parámetros de búsqueda
+
+        Returns:
+            list: Propiedades dentro del círculo de búsqueda, sin repetir
+        """
+        center = center or config.CENTER
+        distance = distance or config.DISTANCE
+        max_pages = max_pages or config.IDEALISTA_API_MAX_PAGES
+        max_depth = max_depth if max_depth is not None else config.IDEALISTA_SWEEP_MAX_DEPTH
+        max_concurrency = max_concurrency or config.API_MAX_CONCURRENCY
+        center_lat, center_lon = parse_center(center)
+
+        # La primera consulta es el círculo pedido, no el cuadrado que lo contiene
+        root = Tile.around(center_lat, center_lon, distance)
+        root_query = {'center': center, 'distance': distance}
+
+        def query(tile):
+            return root_query if tile is root else tile.query()
+
+        def fetch(tile, page):
+            if tile is root and page == 1 and first_page is not None:
+                return first_page
+            return self._search_page(page, **overrides, **query(tile))
+
+        properties = {}
+        calls = 0
+        level = [root]
+
+        def add(tile, elements):
+            for prop in elements:
+                lat, lon = prop.get('latitude'), prop.get('longitude')
+                if lat is not None and lon is not None:
+                    # Los círculos de las teselas se solapan: cada anuncio se
+                    # queda en su tesela y dentro del círculo original
+                    if not tile.contains(lat, lon) or haversine_m(center_lat, center_lon, lat, lon) > distance:
+                        continue
+                properties.setdefault(str(prop.get('propertyCode')), prop)
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            while level:
+                first_pages = list(executor.map(lambda tile: fetch(tile, 1), level))
+                calls += sum(1 for tile in level if not (tile is root and first_page is not None))
+
+                next_level = []
+                remaining = []
+                for tile, data in zip(level, first_pages):
+                    add(tile, data.get('elementList', []))
+                    total_pages = data.get('totalPages', 1) or 1
+                    if total_pages > max_pages and tile.depth < max_depth:
+                        next_level.extend(
+                            child for child in tile.split()
+                            if child.distance_to(center_lat, center_lon) <= distance
+                        )
+                    else:
+                        if total_pages > max_pages:
+                            print(f"⚠️  Tesela en profundidad máxima con {data.get('total')} anuncios: "
+                                  f"solo se leen {max_pages} páginas")
+                        remaining += [(tile, page) for page in range(2, min(total_pages, max_pages) + 1)]
+
+                pages = executor.map(lambda item: fetch(*item), remaining)
+                for (tile, _), data in zip(remaining, pages):
+                    add(tile, data.get('elementList', []))
+                calls += len(remaining)
+
+                level = next_level
+
+        print(f"🗺️  Barrido completado: {len(properties)} anuncio(s) únicos en {calls} llamada(s)")
+        return list(properties.values())
+
+    def sweep_area_if_changed(self, poll_state, center=None, distance=None, **kwargs):
+        """
+        Como sweep_area, pero antes compara la página 1 del círculo (los
+        anuncios más recientes) con la del sondeo anterior: si es igual
+        devuelve None sin teselar, con una sola llamada.
+        """
+        center = center or config.CENTER
+        distance = distance or config.DISTANCE
+        overrides = {k: v for k, v in kwargs.items()
+                     if k not in ('max_pages', 'max_depth', 'max_concurrency')}
+
+        data = self._search_page(1, center=center, distance=distance, **overrides)
+        poll_key = f"sweep:{self._search_key(center=center, distance=distance, **overrides)}"
+        if poll_state.is_unchanged(poll_key, self._page_fingerprint(data.get('elementList', []))):
+            print("ℹ️  Zona sin cambios (mismos anuncios y precios en la página 1)")
+            return None
+
+        return self.sweep_area(center=center, distance=distance, first_page=data, **kwargs)
+
+    def search_properties_if_changed(self, poll_state, **overrides):
+        """
+        Recorre la búsqueda hasta el último anuncio conocido y devuelve todos
+        los anuncios recorridos (los nuevos y los ya conocidos de esas
+        páginas, para seguir sus cambios). Devuelve None si no hay anuncios
+        nuevos ni cambian los precios de la página 1 (la búsqueda es un
+        POST, sin ETag/Last-Modified). Se compara siempre la página 1, la
+        única que se pide en todos los sondeos.
+        """
+        new_properties, visited, first_page = self._walk_new_pages(poll_state, **overrides)
+        unchanged = poll_state.is_unchanged(self._search_key(**overrides), self._page_fingerprint(first_page))
+        if unchanged and not new_properties:
+            print("ℹ️  Búsqueda sin cambios (mismos anuncios y precios)")
+            return None
+
+        return visited
+
     def format_property_data(self, property_data):
         """Formatea los datos de una propiedad para ser más legibles"""
         return {
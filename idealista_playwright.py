@@ -1,78 +1,267 @@
 """
 Scraper de Idealista usando Playwright (navegador real)
 """
-from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
+import asyncio
+import threading
+from urllib.parse import urlparse
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from idealista_document import IdealistaDocument
 import re
 from datetime import datetime
+import config
+
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'
+
+# Recursos que no hacen falta para extraer los datos (el src de las imágenes sigue en el HTML)
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font', 'stylesheet', 'texttrack', 'eventsource', 'websocket', 'manifest'}
+
+# Dominios propios y de terceros imprescindibles (el antibot de Idealista)
+ALLOWED_HOSTS = ('idealista.com', 'idealista.pt', 'idealista.it', 'captcha-delivery.com', 'datadome.co')
+
+# La página está lista en cuanto existen el precio y el título
+READY_SCRIPT = """() => document.querySelector('span.info-data-price, [data-test="price"]')
+    && document.querySelector('.main-info__title-main')"""
+
+
+class BrowserPool:
+    """
+    Chromium persistente con un pool de páginas reutilizables.
+    El navegador vive en un event loop propio (en un hilo aparte), así que
+    se puede usar desde código síncrono y servir varias páginas a la vez.
+    """
+
+    def __init__(self, max_pages=None, recycle_after=None, headless=True):
+        """
+        Args:
+            max_pages: Páginas abiertas a la vez (default: config.PLAYWRIGHT_MAX_CONCURRENCY)
+            recycle_after: Usos de cada contexto antes de recrearlo (default: config.PLAYWRIGHT_RECYCLE_AFTER)
+            headless: Lanzar el navegador sin ventana
+        """
+        self.max_pages = max_pages or config.PLAYWRIGHT_MAX_CONCURRENCY
+        self.recycle_after = recycle_after or config.PLAYWRIGHT_RECYCLE_AFTER
+        self.headless = headless
+
+        self._loop = None
+        self._thread = None
+        self._playwright = None
+        self._browser = None
+        self._idle = []
+        self._slots = None
+        self._uses = {}
+        self._start_lock = threading.Lock()
+
+    def run(self, coro):
+        """Ejecuta una corrutina en el loop del pool y espera el resultado"""
+        self._start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _start(self):
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+
+    async def _ensure_browser(self):
+        """Lanza el navegador (o lo relanza si se ha caído)"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pages)
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        if self._browser is None or not self._browser.is_connected():
+            print("🌐 Lanzando navegador...")
+            self._browser = await self._playwright.chromium.launch(headless=self.headless)
+            self._idle = []
+            self._uses = {}
+
+    async def _new_page(self):
+        context = await self._browser.new_context(
+            user_agent=USER_AGENT,
+            viewport={'width': 1920, 'height': 1080},
+            locale='es-ES'
+        )
+        await context.route('**/*', self._route_request)
+        page = await context.new_page()
+        self._uses[page] = 0
+        return page
+
+    @staticmethod
+    async def _route_request(route):
+        """Aborta recursos no esenciales y peticiones a dominios de terceros"""
+        request = route.request
+        host = urlparse(request.url).hostname or ''
+        if request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        elif not any(host == allowed or host.endswith('.' + allowed) for allowed in ALLOWED_HOSTS):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _discard_page(self, page):
+        self._uses.pop(page, None)
+        try:
+            await page.context.close()
+        except Exception:
+            pass
+
+    async def _acquire_page(self):
+        await self._ensure_browser()
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                page = self._idle.pop()
+                # Comprobación de salud: página abierta y navegador conectado
+                if not page.is_closed() and self._browser.is_connected():
+                    return page
+                await self._discard_page(page)
+            return await self._new_page()
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def _release_page(self, page, healthy=True):
+        try:
+            self._uses[page] = self._uses.get(page, 0) + 1
+            # Reciclar el contexto tras N páginas o si algo ha ido mal
+            if not healthy or self._uses[page] >= self.recycle_after:
+                await self._discard_page(page)
+            else:
+                self._idle.append(page)
+        finally:
+            self._slots.release()
+
+    async def fetch_html(self, url):
+        """Carga una URL en una página del pool y devuelve el HTML"""
+        page = await self._acquire_page()
+        healthy = False
+        try:
+            # Navegar a la página
+            await page.goto(url, wait_until='domcontentloaded', timeout=30000)
+
+            # Esperar a que aparezcan el precio y el título (sin espera fija)
+            try:
+                await page.wait_for_function(READY_SCRIPT, timeout=config.PLAYWRIGHT_READY_TIMEOUT_MS)
+            except PlaywrightTimeoutError:
+                print(f"⚠️  Timeout esperando el contenido de {url}, se usa lo cargado")
+
+            html = await page.content()
+            healthy = True
+            return html
+        finally:
+            await self._release_page(page, healthy)
+
+    async def fetch_many(self, urls):
+        """Carga varias URLs en paralelo (hasta max_pages a la vez). Los fallos se devuelven como excepción"""
+        return await asyncio.gather(*(self.fetch_html(url) for url in urls), return_exceptions=True)
+
+    async def _shutdown(self):
+        for page in list(self._uses):
+            await self._discard_page(page)
+        self._idle = []
+        if self._browser:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def close(self):
+        """Cierra el navegador y detiene el loop"""
+        if self._loop is None:
+            return
+        self.run(self._shutdown())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
 
 
 class IdealistaPlaywrightScraper:
     """Scraper usando Playwright para evitar bloqueos"""
 
+    def __init__(self, max_concurrency=None, recycle_after=None):
+        # El navegador se lanza en la primera petición y se reutiliza hasta close()
+        self.pool = BrowserPool(max_pages=max_concurrency, recycle_after=recycle_after)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Cierra el navegador compartido"""
+        self.pool.close()
+
     def scrape_property_url(self, url):
         """Extrae datos de una URL de propiedad usando un navegador real"""
-        try:
-            print(f"🔍 Scrapeando con navegador: {url}")
+        return self.scrape_many([url])[0]
 
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=True)
-                context = browser.new_context(
-                    user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-                    viewport={'width': 1920, 'height': 1080},
-                    locale='es-ES'
-                )
-                page = context.new_page()
-
-                # Navegar a la página
-                page.goto(url, wait_until='domcontentloaded', timeout=30000)
-
-                # Esperar a que cargue el contenido principal
-                page.wait_for_timeout(2000)
-
-                # Obtener el HTML
-                html = page.content()
-                browser.close()
-
-            # Parsear con BeautifulSoup
-            soup = BeautifulSoup(html, 'lxml')
-
-            property_data = {
-                'id': self._extract_property_id(url),
-                'titulo': self._extract_title(soup),
-                'precio': self._extract_price(soup),
-                'tamaño': self._extract_size(soup),
-                'habitaciones': self._extract_rooms(soup),
-                'baños': self._extract_bathrooms(soup),
-                'direccion': self._extract_address(soup),
-                'distrito': self._extract_district(soup),
-                'planta': self._extract_floor(soup),
-                'exterior': self._extract_feature(soup, 'exterior'),
-                'ascensor': self._extract_feature(soup, 'ascensor'),
-                'parking': self._extract_feature(soup, 'garaje') or self._extract_feature(soup, 'parking'),
-                'url': url,
-                'thumbnail': self._extract_main_image(soup),
-                'descripcion': self._extract_description(soup),
-                'fecha_actualizacion': datetime.now().strftime('%Y-%m-%d'),
-                'precio_m2': 0
-            }
-
-            # Calcular precio/m²
-            if property_data['tamaño'] and property_data['tamaño'] > 0:
-                property_data['precio_m2'] = round(property_data['precio'] / property_data['tamaño'], 2)
-
-            print(f"✅ Datos extraídos: {property_data['titulo']} - {property_data['precio']}€")
-            return property_data
+    def scrape_many(self, urls):
+        """
+        Extrae datos de varias URLs reutilizando el mismo navegador.
+        Devuelve los resultados en el mismo orden (None si falla).
+        """
+        for url in urls:
+            print(f"🔍 Scrapeando con navegador: {url}")
 
+        try:
+            pages = self.pool.run(self.pool.fetch_many(urls))
         except Exception as e:
-            print(f"❌ Error scrapeando {url}: {e}")
-            return None
+            print(f"❌ Error con el navegador: {e}")
+            return [None] * len(urls)
+
+        results = []
+        for url, html in zip(urls, pages):
+            if isinstance(html, Exception):
+                print(f"❌ Error scrapeando {url}: {html}")
+                results.append(None)
+                continue
+            try:
+                results.append(self._parse_property_page(html, url))
+            except Exception as e:
+                print(f"❌ Error scrapeando {url}: {e}")
+                results.append(None)
+        return results
+
+    def _parse_property_page(self, html, url):
+        """Extrae los datos de la página de detalle de una propiedad"""
+        # Parsear una sola vez (texto y nodos comunes cacheados)
+        doc = IdealistaDocument(html, 'lxml')
+
+        property_data = {
+            'id': self._extract_property_id(url),
+            'titulo': self._extract_title(doc),
+            'precio': self._extract_price(doc),
+            'tamaño': self._extract_size(doc),
+            'habitaciones': self._extract_rooms(doc),
+            'baños': self._extract_bathrooms(doc),
+            'direccion': self._extract_address(doc),
+            'distrito': self._extract_district(doc),
+            'planta': self._extract_floor(doc),
+            'exterior': self._extract_feature(doc, 'exterior'),
+            'ascensor': self._extract_feature(doc, 'ascensor'),
+            'parking': self._extract_feature(doc, 'garaje') or self._extract_feature(doc, 'parking'),
+            'url': url,
+            'thumbnail': self._extract_main_image(doc),
+            'descripcion': self._extract_description(doc),
+            'fecha_actualizacion': datetime.now().strftime('%Y-%m-%d'),
+            'precio_m2': 0
+        }
+
+        # Calcular precio/m²
+        if property_data['tamaño'] and property_data['tamaño'] > 0:
+            property_data['precio_m2'] = round(property_data['precio'] / property_data['tamaño'], 2)
+
+        print(f"✅ Datos extraídos: {property_data['titulo']} - {property_data['precio']}€")
+        return property_data
 
     def _extract_property_id(self, url):
         match = re.search(r'/inmueble/(\d+)', url)
         return match.group(1) if match else url.split('/')[-2]
 
-    def _extract_title(self, soup):
+    def _extract_title(self, doc):
         # Intentar varios selectores
         selectors = [
             'h1.main-info__title-main',
@@ -81,19 +270,19 @@ class IdealistaPlaywrightScraper:
             '.detail-info-title'
         ]
         for sel in selectors:
-            el = soup.select_one(sel)
+            el = doc.select_one(sel)
             if el:
                 return el.text.strip()
         return 'Sin título'
 
-    def _extract_price(self, soup):
+    def _extract_price(self, doc):
         selectors = [
             'span.info-data-price',
             '[class*="price"]',
             '.price'
         ]
         for sel in selectors:
-            el = soup.select_one(sel)
+            el = doc.select_one(sel)
             if el:
                 price_text = el.text
                 price_clean = re.sub(r'[^\d]', '', price_text)
@@ -101,79 +290,75 @@ class IdealistaPlaywrightScraper:
                     return int(price_clean)
         return 0
 
-    def _extract_size(self, soup):
+    def _extract_size(self, doc):
         # Buscar en el texto de la página
-        text = soup.get_text()
+        text = doc.text
         match = re.search(r'(\d+)\s*m²\s*(?:construidos|útiles)?', text)
         if match:
             return int(match.group(1))
 
         # Buscar en elementos específicos
-        for el in soup.find_all(['span', 'div', 'li']):
+        for el in doc.soup.find_all(['span', 'div', 'li']):
             if 'm²' in el.text and 'construidos' in el.text.lower():
                 match = re.search(r'(\d+)', el.text)
                 if match:
                     return int(match.group(1))
         return 0
 
-    def _extract_rooms(self, soup):
-        text = soup.get_text()
+    def _extract_rooms(self, doc):
+        text = doc.text
         match = re.search(r'(\d+)\s*(?:habitacion|hab\.)', text, re.IGNORECASE)
         return int(match.group(1)) if match else 0
 
-    def _extract_bathrooms(self, soup):
-        text = soup.get_text()
+    def _extract_bathrooms(self, doc):
+        text = doc.text
         match = re.search(r'(\d+)\s*(?:baño|wc)', text, re.IGNORECASE)
         return int(match.group(1)) if match else 0
 
-    def _extract_address(self, soup):
+    def _extract_address(self, doc):
         selectors = [
             'span.main-info__title-minor',
             '.detail-info__address',
             '[class*="location"]'
         ]
         for sel in selectors:
-            el = soup.select_one(sel)
+            el = doc.select_one(sel)
             if el:
                 return el.text.strip()
         return 'No disponible'
 
-    def _extract_district(self, soup):
-        breadcrumb = soup.select_one('nav.breadcrumb-container, .breadcrumb')
-        if breadcrumb:
-            items = breadcrumb.find_all('li')
-            if len(items) > 2:
-                return items[-2].text.strip()
+    def _extract_district(self, doc):
+        items = doc.breadcrumb_items
+        if len(items) > 2:
+            return items[-2].text.strip()
         return ''
 
-    def _extract_floor(self, soup):
-        text = soup.get_text()
-        match = re.search(r'(\d+)[ªº]?\s*planta', text, re.IGNORECASE)
+    def _extract_floor(self, doc):
+        match = re.search(r'(\d+)[ªº]?\s*planta', doc.text, re.IGNORECASE)
         if match:
             return match.group(1)
-        if 'bajo' in text.lower():
+        if 'bajo' in doc.text_lower:
             return 'Bajo'
         return ''
 
-    def _extract_feature(self, soup, keyword):
-        text = soup.get_text().lower()
-        return keyword.lower() in text
+    def _extract_feature(self, doc, keyword):
+        return keyword.lower() in doc.text_lower
 
-    def _extract_main_image(self, soup):
+    def _extract_main_image(self, doc):
         # Buscar imagen principal
-        img = soup.select_one('img[class*="detail"], img[class*="gallery"], picture img')
+        img = doc.select_one('img[class*="detail"], img[class*="gallery"], picture img')
         if img:
             return img.get('src', '') or img.get('data-src', '')
         return ''
 
-    def _extract_description(self, soup):
+    def _extract_description(self, doc):
         selectors = [
             'div.comment',
             '.description',
             '[class*="description"]'
         ]
         for sel in selectors:
-            el = soup.select_one(sel)
+            el = doc.select_one(sel)
             if el:
                 return el.text.strip()[:500]
         return ''
@@ -181,8 +366,8 @@ class IdealistaPlaywrightScraper:
 
 # Test
 if __name__ == '__main__':
-    scraper = IdealistaPlaywrightScraper()
-    result = scraper.scrape_property_url('https://www.idealista.com/inmueble/109665235/')
+    with IdealistaPlaywrightScraper() as scraper:
+        result = scraper.scrape_property_url('https://www.idealista.com/inmueble/109665235/')
     if result:
         print(f"\nResultado:")
         print(f"  Precio: {result['precio']}€")
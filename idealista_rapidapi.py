@@ -1,6 +1,15 @@
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from urllib.parse import urlencode
 import config
+from http_client import api_request, create_session, listing_fingerprint
+from response_cache import ResponseCache
+from quota_budget import QuotaLedger, QuotaScheduler, FIRST_PAGE, DEEP_PAGE, DETAIL
+
+
+class QuotaBudgetExceeded(requests.exceptions.RequestException):
+    """La llamada no cabe en el presupuesto de cuota del periodo"""
 
 
 class IdealistaRapidAPI:
@@ -14,6 +23,20 @@ class IdealistaRapidAPI:
             'X-RapidAPI-Key': self.api_key,
             'X-RapidAPI-Host': self.api_host
         }
+        # Sesión keep-alive con una conexión por cada petición simultánea
+        self.max_concurrency = config.RAPIDAPI_MAX_CONCURRENCY
+        self.session = create_session(pool_size=self.max_concurrency)
+
+        # Caché persistente de respuestas (cada llamada se paga)
+        self.cache = ResponseCache(config.RAPIDAPI_CACHE_FILE) if config.RAPIDAPI_CACHE_ENABLED else None
+        self.cache_ttls = {
+            'listhomes': (config.RAPIDAPI_CACHE_TTL_LISTHOMES, config.RAPIDAPI_CACHE_STALE_LISTHOMES),
+            'property': (config.RAPIDAPI_CACHE_TTL_PROPERTY, config.RAPIDAPI_CACHE_STALE_PROPERTY),
+        }
+
+        # Cuota del plan: registro persistente y reparto a lo largo del periodo
+        self.quota = QuotaLedger()
+        self.scheduler = QuotaScheduler(self.quota)
 
     def search_properties(self, location_id=None, location_name=None, operation=None,
                           num_page=1, max_items=40, order='relevance', **filters):
@@ -33,7 +56,60 @@ class IdealistaRapidAPI:
             dict: Respuesta completa de la API con propiedades
         """
         url = f"{self.base_url}/listhomes"
+        params = self._search_params(location_id, location_name, operation,
+                                     num_page, max_items, order, **filters)
+
+        priority = FIRST_PAGE if num_page == 1 else DEEP_PAGE
 
+        try:
+            return self._cached_get_json('listhomes', url, params, priority)
+
+        except requests.exceptions.RequestException as e:
+            print(f"Error buscando propiedades: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                print(f"Codigo de estado: {e.response.status_code}")
+                print(f"Respuesta: {e.response.text[:500]}")
+            raise
+
+    def search_properties_if_changed(self, poll_state, **kwargs):
+        """
+        Busca propiedades con GET condicional y hash de resultados.
+
+        Args:
+            poll_state: PollStateStore con el estado de la búsqueda
+            **kwargs: Parámetros de search_properties
+
+        Returns:
+            list: Propiedades encontradas, o None si nada ha cambiado desde la última consulta
+        """
+        url = f"{self.base_url}/listhomes"
+        params = self._search_params(**kwargs)
+        poll_key = self._request_key(url, params)
+
+        response = self._get(url, params=params, poll_state=poll_state, poll_key=poll_key,
+                             priority=FIRST_PAGE)
+        if response is None:
+            print("Busqueda sin cambios (304)")
+            return None
+
+        data = response.json()
+        if self.cache:
+            # La respuesta fresca también sirve a search_properties
+            self.cache.set(poll_key, 'listhomes', data)
+
+        properties = self._extract_properties(data)
+        fingerprint = listing_fingerprint(
+            [[p.get('propertyCode', p.get('id')), p.get('price')] for p in properties]
+        )
+        if poll_state.is_unchanged(poll_key, fingerprint):
+            print("Busqueda sin cambios (mismos resultados)")
+            return None
+
+        return properties
+
+    def _search_params(self, location_id=None, location_name=None, operation=None,
+                       num_page=1, max_items=40, order='relevance', **filters):
+        """Construye los parámetros de /listhomes a partir de config y los filtros"""
         # Usar valores de config como defaults
         params = {
             'order': order,
@@ -63,29 +139,66 @@ class IdealistaRapidAPI:
             if value is not None:
                 params[key] = value
 
-        try:
-            response = requests.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
+        return params
 
-            data = response.json()
-            return data
+    @staticmethod
+    def _request_key(url, params=None):
+        """Clave normalizada de una petición (parámetros ordenados)"""
+        return f"{url}?{urlencode(sorted((params or {}).items()))}"
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error buscando propiedades: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Codigo de estado: {e.response.status_code}")
-                print(f"Respuesta: {e.response.text[:500]}")
-            raise
+    def _cached_get_json(self, endpoint, url, params=None, priority=FIRST_PAGE):
+        """GET con caché: TTL corto para /listhomes, largo para /property/<code>"""
+        def fetch():
+            return self._get(url, params=params, priority=priority).json()
 
-    def get_properties_list(self, **kwargs):
-        """
-        Obtiene la lista de propiedades de la búsqueda.
+        if not self.cache:
+            return fetch()
 
-        Returns:
-            list: Lista de propiedades encontradas
+        ttl, stale_ttl = self.cache_ttls[endpoint]
+        return self.cache.get_or_fetch(self._request_key(url, params), endpoint, fetch, ttl, stale_ttl)
+
+    def purge_cache(self):
+        """Borra de la caché lo que ya no se puede servir (pasado su TTL + ventana stale)"""
+        if not self.cache:
+            return 0
+        return sum(self.cache.purge(ttl + stale_ttl, endpoint)
+                   for endpoint, (ttl, stale_ttl) in self.cache_ttls.items())
+
+    def cache_summary(self):
+        """Estadísticas de la caché de respuestas"""
+        return self.cache.summary() if self.cache else "caché desactivada"
+
+    def next_poll_interval(self, calls_per_poll=1):
+        """Segundos hasta el próximo sondeo según la cuota que queda en el periodo"""
+        return self.scheduler.next_interval(calls_per_poll)
+
+    def _get(self, url, params=None, poll_state=None, poll_key=None, priority=FIRST_PAGE):
         """
-        data = self.search_properties(**kwargs)
+        GET a la API. Con poll_state envía los validadores guardados
+        (If-None-Match / If-Modified-Since) y devuelve None si la respuesta es 304.
+        Cada llamada se anota en la cuota; si su prioridad no cabe en el
+        presupuesto lanza QuotaBudgetExceeded sin llamar a la API.
+        """
+        if not self.scheduler.allow(priority):
+            raise QuotaBudgetExceeded(f"Sin presupuesto de cuota para {priority}: {url}")
 
+        headers = dict(self.headers)
+        if poll_state:
+            headers.update(poll_state.conditional_headers(poll_key))
+
+        response = api_request(self.session, 'GET', url, headers=headers, params=params)
+        self.quota.record(priority, response.headers)
+        if poll_state and response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        if poll_state:
+            poll_state.update_validators(poll_key, response)
+        return response
+
+    @staticmethod
+    def _extract_properties(data):
+        """Extrae la lista de propiedades de una respuesta de /listhomes"""
         if isinstance(data, dict):
             # La API puede devolver la lista en diferentes campos
             return data.get('elementList', data.get('elements', data.get('properties', [])))
@@ -93,6 +206,16 @@ class IdealistaRapidAPI:
             return data
         return []
 
+    def get_properties_list(self, **kwargs):
+        """
+        Obtiene la lista de propiedades de la búsqueda.
+
+        Returns:
+            list: Lista de propiedades encontradas
+        """
+        data = self.search_properties(**kwargs)
+        return self._extract_properties(data)
+
     def format_property_data(self, property_data):
         """Formatea los datos de una propiedad para ser más legibles"""
         price = property_data.get('price', 0)
@@ -136,46 +259,88 @@ class IdealistaRapidAPI:
         url = f"{self.base_url}/property/{property_code}"
 
         try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
+            return self._cached_get_json('property', url, priority=DETAIL)
+        except QuotaBudgetExceeded as e:
+            print(f"⏸️  {e}")
+            return None
         except requests.exceptions.RequestException as e:
             print(f"Error obteniendo detalles de propiedad {property_code}: {e}")
             return None
 
-    def search_all_pages(self, max_pages=10, **kwargs):
+    def get_many_property_details(self, codes, max_concurrency=None):
+        """
+        Obtiene los detalles de varias propiedades en paralelo.
+        Los códigos repetidos se piden una sola vez y los consultados hace
+        poco salen de la caché sin llamar a la API.
+
+        Args:
+            codes: Códigos de propiedad
+            max_concurrency: Peticiones simultáneas (default: config.RAPIDAPI_MAX_CONCURRENCY)
+
+        Yields:
+            tuple: (código, detalles o None) según va terminando cada petición
+        """
+        codes = list(dict.fromkeys(str(code) for code in codes if code))
+        if not codes:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(len(codes), max_concurrency or self.max_concurrency))
+        try:
+            futures = {executor.submit(self.get_property_details, code): code for code in codes}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Si quien consume deja de iterar, no lanzar las peticiones pendientes
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def search_all_pages(self, max_pages=10, max_concurrency=None, **kwargs):
         """
         Busca propiedades en múltiples páginas.
+        La página 1 indica el total de páginas; las siguientes se piden en paralelo.
 
         Args:
             max_pages: Número máximo de páginas a buscar
+            max_concurrency: Páginas simultáneas (default: config.RAPIDAPI_MAX_CONCURRENCY)
             **kwargs: Parámetros de búsqueda
 
         Returns:
-            list: Lista completa de propiedades de todas las páginas
+            list: Lista completa de propiedades de todas las páginas (en orden de página)
         """
-        all_properties = []
-
-        for page in range(1, max_pages + 1):
-            print(f"Buscando pagina {page}...")
-
-            data = self.search_properties(num_page=page, **kwargs)
+        max_concurrency = max_concurrency or self.max_concurrency
 
-            if isinstance(data, dict):
-                properties = data.get('elementList', data.get('elements', []))
-                total_pages = data.get('totalPages', 1)
-            else:
-                properties = data if isinstance(data, list) else []
-                total_pages = 1
+        print("Buscando pagina 1...")
+        data = self.search_properties(num_page=1, **kwargs)
 
-            if not properties:
-                break
-
-            all_properties.extend(properties)
-
-            # Si ya obtuvimos todas las páginas disponibles, salir
-            if page >= total_pages:
-                break
+        if isinstance(data, dict):
+            all_properties = list(data.get('elementList', data.get('elements', [])))
+            total_pages = data.get('totalPages', 1)
+        else:
+            all_properties = list(data) if isinstance(data, list) else []
+            total_pages = 1
+
+        last_page = min(max_pages, total_pages or 1)
+
+        if all_properties and last_page > 1:
+            # Las páginas 2+ solo gastan el margen de cuota sobre el ritmo previsto
+            affordable = self.scheduler.affordable(DEEP_PAGE, last_page - 1)
+            if affordable < last_page - 1:
+                print(f"Cuota: solo {affordable} pagina(s) adicional(es) dentro del presupuesto")
+                last_page = 1 + affordable
+
+        if all_properties and last_page > 1:
+            pages = list(range(2, last_page + 1))
+            print(f"Buscando paginas 2-{last_page} ({max_concurrency} en paralelo)...")
+
+            def fetch_page(page):
+                page_data = self.search_properties(num_page=page, **kwargs)
+                if isinstance(page_data, dict):
+                    return page_data.get('elementList', page_data.get('elements', []))
+                return page_data if isinstance(page_data, list) else []
+
+            # executor.map devuelve los resultados en orden de página
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                for properties in executor.map(fetch_page, pages):
+                    all_properties.extend(properties)
 
         print(f"Total propiedades encontradas: {len(all_properties)}")
         return all_properties
@@ -205,5 +370,8 @@ if __name__ == "__main__":
             print(f"   URL: {formatted['url']}")
             print()
 
+        print(api.cache_summary())
+        print(api.scheduler.summary())
+
     except Exception as e:
         print(f"Error: {e}")
@@ -2,7 +2,12 @@ import requests
 from bs4 import BeautifulSoup
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import config
+from idealista_document import IdealistaDocument
+from http_client import FetchEngine, PollStateStore, listing_fingerprint
 
 try:
     import cloudscraper
@@ -34,6 +39,12 @@ class IdealistaScraper:
             'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
             'Referer': 'https://www.idealista.com/',
         })
+
+        # Límite de peticiones por dominio y simultáneas (ver config.SCRAPER_*)
+        self.engine = FetchEngine(self.session)
+        
+        # Validadores HTTP y hash de resultados de las búsquedas sondeadas
+        self.poll_state = PollStateStore()
         
     def scrape_property_url(self, url):
         """
@@ -43,37 +54,10 @@ class IdealistaScraper:
         try:
             print(f"🔍 Scrapeando: {url}")
 
-            response = self.session.get(url, timeout=15)
+            response = self.engine.get(url, timeout=15)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'lxml')
-            
-            # Extraer datos de la página
-            property_data = {
-                'id': self._extract_property_id(url),
-                'titulo': self._extract_title(soup),
-                'precio': self._extract_price(soup),
-                'tamaño': self._extract_size(soup),
-                'habitaciones': self._extract_rooms(soup),
-                'baños': self._extract_bathrooms(soup),
-                'direccion': self._extract_address(soup),
-                'distrito': self._extract_district(soup),
-                'municipio': self._extract_municipality(soup),
-                'provincia': self._extract_province(soup),
-                'planta': self._extract_floor(soup),
-                'exterior': self._extract_exterior(soup),
-                'ascensor': self._extract_elevator(soup),
-                'parking': self._extract_parking(soup),
-                'url': url,
-                'thumbnail': self._extract_main_image(soup),
-                'descripcion': self._extract_description(soup),
-                'fecha_actualizacion': datetime.now().strftime('%Y-%m-%d'),
-                'precio_m2': 0
-            }
-            
-            # Calcular precio/m²
-            if property_data['tamaño'] and property_data['tamaño'] > 0:
-                property_data['precio_m2'] = round(property_data['precio'] / property_data['tamaño'], 2)
+            property_data = self._parse_property_page(response.content, url)
             
             print(f"✅ Datos extraídos: {property_data['titulo']}")
             return property_data
@@ -82,52 +66,283 @@ class IdealistaScraper:
             print(f"❌ Error scrapeando {url}: {e}")
             return None
     
+    def scrape_property_urls(self, urls):
+        """
+        Scrapea varias URLs de propiedad en paralelo respetando el límite
+        por dominio. Devuelve los resultados en el mismo orden (None si falla)
+        """
+        return self.engine.map(self.scrape_property_url, urls)
+    
+    def enrich_properties(self, properties, time_budget=None):
+        """
+        Completa propiedades del listado con los datos de su ficha, en paralelo.
+        Se piden en orden (las primeras, más recientes, antes) y dentro de un
+        tiempo máximo por ciclo; las que no da tiempo a completar se devuelven tal cual.
+        
+        Args:
+            properties: Propiedades extraídas del listado
+            time_budget: Segundos máximos (default: config.ENRICH_TIME_BUDGET_SECONDS)
+        
+        Returns:
+            list: Propiedades (completadas o no) en el mismo orden
+        """
+        if not properties:
+            return []
+        
+        time_budget = time_budget if time_budget is not None else config.ENRICH_TIME_BUDGET_SECONDS
+        
+        executor = ThreadPoolExecutor(max_workers=self.engine.max_concurrency)
+        futures = [executor.submit(self.scrape_property_url, prop['url']) for prop in properties]
+        try:
+            done, _ = wait(futures, timeout=time_budget)
+        finally:
+            # Las que no han empezado se cancelan; no esperamos a las que siguen en curso
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        enriched = []
+        for prop, future in zip(properties, futures):
+            details = future.result() if future in done else None
+            enriched.append(self._merge_details(prop, details) if details else prop)
+        
+        completed = sum(1 for prop, future in zip(properties, futures) if future in done and future.result())
+        print(f"🔎 Detalles completados: {completed}/{len(properties)}")
+        return enriched
+    
+    @staticmethod
+    def _merge_details(listing, details):
+        """Combina los datos del listado con los de la ficha (la ficha manda si tiene valor)"""
+        merged = dict(listing)
+        for key, value in details.items():
+            if key in ('id', 'url'):
+                continue
+            if value in (None, '', 'N/A', 'No disponible', 'Sin título') or value == 0:
+                continue
+            merged[key] = value
+        return merged
+    
+    def _parse_property_page(self, content, url):
+        """Extrae los datos de la página de detalle de una propiedad"""
+        doc = IdealistaDocument(content, 'lxml')
+        
+        # Extraer datos de la página
+        property_data = {
+            'id': self._extract_property_id(url),
+            'titulo': self._extract_title(doc),
+            'precio': self._extract_price(doc),
+            'tamaño': self._extract_size(doc),
+            'habitaciones': self._extract_rooms(doc),
+            'baños': self._extract_bathrooms(doc),
+            'direccion': self._extract_address(doc),
+            'distrito': self._extract_district(doc),
+            'municipio': self._extract_municipality(doc),
+            'provincia': self._extract_province(doc),
+            'planta': self._extract_floor(doc),
+            'exterior': self._extract_exterior(doc),
+            'ascensor': self._extract_elevator(doc),
+            'parking': self._extract_parking(doc),
+            'url': url,
+            'thumbnail': self._extract_main_image(doc),
+            'descripcion': self._extract_description(doc),
+            'fecha_actualizacion': datetime.now().strftime('%Y-%m-%d'),
+            'precio_m2': 0
+        }
+        
+        # Calcular precio/m²
+        if property_data['tamaño'] and property_data['tamaño'] > 0:
+            property_data['precio_m2'] = round(property_data['precio'] / property_data['tamaño'], 2)
+        
+        return property_data
+    
     def scrape_search_results(self, search_url):
         """
         Scrapea una página de resultados de búsqueda
         Ejemplo: https://www.idealista.com/venta-viviendas/madrid/chamberi/
         """
+        properties, _ = self._scrape_search_page(search_url)
+        return properties
+    
+    def poll_search(self, search_url, seen_ids=None, max_pages=None, poll_state=None):
+        """
+        Igual que scrape_search_pages, pero con GET condicional de la primera
+        página. Devuelve None si no ha cambiado desde la última consulta
+        (304 o mismo bloque de resultados), sin parsear nada.
+        
+        Los validadores y el hash nuevos se anotan en `poll_state` (default:
+        self.poll_state). Lo normal es pasar un self.poll_state.begin() y
+        hacer commit() solo cuando los resultados se han procesado.
+        
+        Si la primera página no se puede descargar se relanza el error, para
+        que el ciclo no haga commit() como si la búsqueda estuviera vacía.
+        """
+        poll_state = poll_state or self.poll_state
+        page_url = self.build_search_page_url(search_url, 1)
+        
+        try:
+            print(f"🔍 Comprobando cambios: {page_url}")
+            response = self.engine.get_if_modified(page_url, poll_state, timeout=10)
+            if response is None:
+                print("ℹ️  Búsqueda sin cambios (304)")
+                return None
+            response.raise_for_status()
+        except Exception as e:
+            print(f"❌ Error scrapeando búsqueda: {e}")
+            raise
+        
+        fingerprint = self._search_page_fingerprint(response.text)
+        if fingerprint and poll_state.is_unchanged(page_url, fingerprint):
+            print("ℹ️  Búsqueda sin cambios (mismos resultados)")
+            return None
+        
+        first_page = self._parse_search_page(response.content)
+        return self.scrape_search_pages(search_url, seen_ids, max_pages, first_page=first_page)
+    
+    def _search_page_fingerprint(self, html):
+        """
+        Hash normalizado del bloque de resultados (IDs y precios), sacado del
+        HTML con expresiones regulares para no tener que parsear la página
+        """
+        ids = re.findall(r'data-element-id="(\d+)"', html)
+        if not ids:
+            return None
+        prices = [re.sub(r'[^\d]', '', p) for p in re.findall(r'class="item-price[^"]*"[^>]*>([^<]*)', html)]
+        return listing_fingerprint([ids, prices])
+    
+    def scrape_search_pages(self, search_url, seen_ids=None, max_pages=None, prefetch=True, first_page=None):
+        """
+        Recorre las páginas de resultados (pagina-N.htm) ordenadas por fecha
+        de publicación y se detiene en cuanto una página solo contiene
+        propiedades ya vistas.
+        
+        Args:
+            search_url: URL de búsqueda de Idealista
+            seen_ids: IDs ya vistos (set de strings o PropertyStore)
+            max_pages: Máximo de páginas a recorrer (default: config.SCRAPER_MAX_SEARCH_PAGES)
+            prefetch: Descargar la página siguiente mientras se procesa la actual
+            first_page: Resultado ya obtenido de la página 1 (propiedades, hay_siguiente)
+        
+        Returns:
+            list: Propiedades de todas las páginas recorridas
+        """
+        seen_ids = seen_ids if seen_ids is not None else set()
+        max_pages = max_pages or config.SCRAPER_MAX_SEARCH_PAGES
+        
+        all_properties = []
+        collected_ids = set()
+        
+        prefetcher = ThreadPoolExecutor(max_workers=1)
+        pending = None
+        page = 0
+        
+        try:
+            for page in range(1, max_pages + 1):
+                if page == 1 and first_page is not None:
+                    properties, has_next = first_page
+                elif pending:
+                    properties, has_next = pending.result()
+                else:
+                    properties, has_next = self._scrape_search_page(self.build_search_page_url(search_url, page))
+                pending = None
+                
+                # Adelantar la descarga de la página siguiente
+                if prefetch and has_next and page < max_pages:
+                    next_url = self.build_search_page_url(search_url, page + 1)
+                    pending = prefetcher.submit(self._scrape_search_page, next_url)
+                
+                page_ids = {str(prop['id']) for prop in properties}
+                
+                # Idealista redirige a la última página si nos pasamos
+                if not page_ids or page_ids <= collected_ids:
+                    break
+                
+                collected_ids |= page_ids
+                all_properties.extend(properties)
+                
+                if all(pid in seen_ids for pid in page_ids):
+                    print(f"⏹️  Página {page} sin propiedades nuevas, fin del recorrido")
+                    break
+                
+                if not has_next:
+                    break
+        finally:
+            # No esperar a una página adelantada que ya no hace falta
+            prefetcher.shutdown(wait=False, cancel_futures=True)
+        
+        print(f"✅ Total: {len(all_properties)} propiedades en {page} página(s)")
+        return all_properties
+    
+    @staticmethod
+    def build_search_page_url(search_url, page):
+        """
+        Construye la URL de la página N de una búsqueda ordenada por fecha de publicación
+        Ejemplo: .../madrid/chamberi/pagina-3.htm?ordenado-por=fecha-publicacion-desc
+        """
+        parts = urlsplit(search_url)
+        
+        path = re.sub(r'pagina-\d+\.htm$', '', parts.path)
+        if not path.endswith('/'):
+            path += '/'
+        if page > 1:
+            path += f'pagina-{page}.htm'
+        
+        query = dict(parse_qsl(parts.query))
+        query['ordenado-por'] = 'fecha-publicacion-desc'
+        
+        return urlunsplit((parts.scheme, parts.netloc, path, urlencode(query), ''))
+    
+    def _scrape_search_page(self, search_url):
+        """Descarga y parsea una página de resultados. Devuelve (propiedades, hay_siguiente)"""
         try:
             print(f"🔍 Scrapeando resultados: {search_url}")
             
-            response = self.session.get(search_url, timeout=10)
+            response = self.engine.get(search_url, timeout=10)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'lxml')
-            
-            # Encontrar todos los artículos de propiedades
-            property_items = soup.find_all('article', class_='item')
-            
-            if not property_items:
-                # Intentar con otro selector
-                property_items = soup.find_all('div', class_='item-info-container')
-            
-            properties = []
-            
-            for item in property_items:
-                try:
-                    # Extraer URL de la propiedad
-                    link = item.find('a', class_='item-link')
-                    if not link:
-                        continue
-                        
-                    property_url = 'https://www.idealista.com' + link.get('href', '')
-                    
-                    # Extraer datos básicos del listado
-                    property_data = self._extract_from_listing(item, property_url)
-                    if property_data:
-                        properties.append(property_data)
-                        
-                except Exception as e:
-                    print(f"⚠️  Error extrayendo propiedad de listado: {e}")
-                    continue
-            
-            print(f"✅ Extraídas {len(properties)} propiedades de la búsqueda")
-            return properties
+            return self._parse_search_page(response.content)
             
         except Exception as e:
             print(f"❌ Error scrapeando búsqueda: {e}")
-            return []
+            return [], False
+    
+    def _parse_search_page(self, content):
+        """Extrae las propiedades de una página de resultados"""
+        soup = BeautifulSoup(content, 'lxml')
+        
+        # Encontrar todos los artículos de propiedades
+        property_items = soup.find_all('article', class_='item')
+        
+        if not property_items:
+            # Intentar con otro selector
+            property_items = soup.find_all('div', class_='item-info-container')
+        
+        properties = []
+        
+        for item in property_items:
+            try:
+                # Extraer URL de la propiedad
+                link = item.find('a', class_='item-link')
+                if not link:
+                    continue
+                    
+                property_url = 'https://www.idealista.com' + link.get('href', '')
+                
+                # Extraer datos básicos del listado
+                property_data = self._extract_from_listing(item, property_url)
+                if property_data:
+                    properties.append(property_data)
+                    
+            except Exception as e:
+                print(f"⚠️  Error extrayendo propiedad de listado: {e}")
+                continue
+        
+        # Enlace a la página siguiente (si no hay paginador, seguir mientras haya resultados)
+        pagination = soup.select_one('div.pagination')
+        if pagination:
+            has_next = pagination.select_one('li.next') is not None
+        else:
+            has_next = bool(properties)
+        
+        print(f"✅ Extraídas {len(properties)} propiedades de la búsqueda")
+        return properties, has_next
     
     def _extract_from_listing(self, item, url):
         """Extrae datos básicos de un item en el listado"""
@@ -190,18 +405,18 @@ class IdealistaScraper:
         match = re.search(r'/inmueble/(\d+)', url)
         return match.group(1) if match else url.split('/')[-2]
     
-    def _extract_title(self, soup):
+    def _extract_title(self, doc):
         """Extrae el título de la propiedad"""
-        title = soup.find('h1', class_='main-info__title-main')
+        title = doc.soup.find('h1', class_='main-info__title-main')
         if not title:
-            title = soup.find('span', class_='main-info__title-main')
+            title = doc.soup.find('span', class_='main-info__title-main')
         return title.text.strip() if title else 'Sin título'
     
-    def _extract_price(self, soup):
+    def _extract_price(self, doc):
         """Extrae el precio"""
-        price = soup.find('span', class_='info-data-price')
+        price = doc.soup.find('span', class_='info-data-price')
         if not price:
-            price = soup.find('span', {'data-test': 'price'})
+            price = doc.soup.find('span', {'data-test': 'price'})
         price_text = price.text if price else '0'
         return self._clean_price(price_text)
     
@@ -211,100 +426,84 @@ class IdealistaScraper:
         price_clean = re.sub(r'[^\d]', '', price_text)
         return int(price_clean) if price_clean else 0
     
-    def _extract_size(self, soup):
+    def _extract_size(self, doc):
         """Extrae el tamaño en m²"""
-        size = soup.find('span', string=re.compile(r'm²\s*construidos'))
+        size = doc.soup.find('span', string=re.compile(r'm²\s*construidos'))
         if size:
             size_text = size.text
             match = re.search(r'(\d+)\s*m²', size_text)
             return int(match.group(1)) if match else 0
         return 0
     
-    def _extract_rooms(self, soup):
+    def _extract_rooms(self, doc):
         """Extrae el número de habitaciones"""
-        rooms = soup.find('span', string=re.compile(r'habitacion'))
+        rooms = doc.soup.find('span', string=re.compile(r'habitacion'))
         if rooms:
             match = re.search(r'(\d+)', rooms.text)
             return int(match.group(1)) if match else 0
         return 0
     
-    def _extract_bathrooms(self, soup):
+    def _extract_bathrooms(self, doc):
         """Extrae el número de baños"""
-        baths = soup.find('span', string=re.compile(r'baño'))
+        baths = doc.soup.find('span', string=re.compile(r'baño'))
         if baths:
             match = re.search(r'(\d+)', baths.text)
             return int(match.group(1)) if match else 0
         return 0
     
-    def _extract_address(self, soup):
+    def _extract_address(self, doc):
         """Extrae la dirección"""
-        address = soup.find('span', class_='main-info__title-minor')
+        address = doc.select_one('span.main-info__title-minor')
         return address.text.strip() if address else 'No disponible'
     
-    def _extract_district(self, soup):
+    def _extract_district(self, doc):
         """Extrae el distrito"""
-        breadcrumb = soup.find('nav', class_='breadcrumb-container')
-        if breadcrumb:
-            items = breadcrumb.find_all('li')
-            if len(items) > 2:
-                return items[-2].text.strip()
+        items = doc.breadcrumb_items
+        if len(items) > 2:
+            return items[-2].text.strip()
         return 'No disponible'
     
-    def _extract_municipality(self, soup):
+    def _extract_municipality(self, doc):
         """Extrae el municipio"""
-        breadcrumb = soup.find('nav', class_='breadcrumb-container')
-        if breadcrumb:
-            items = breadcrumb.find_all('li')
-            if len(items) > 1:
-                return items[-3].text.strip() if len(items) > 2 else items[-2].text.strip()
+        items = doc.breadcrumb_items
+        if len(items) > 1:
+            return items[-3].text.strip() if len(items) > 2 else items[-2].text.strip()
         return 'No disponible'
     
-    def _extract_province(self, soup):
+    def _extract_province(self, doc):
         """Extrae la provincia"""
-        address = self._extract_address(soup)
+        address = self._extract_address(doc)
         # Intentar extraer de la dirección
         if ',' in address:
             parts = address.split(',')
             return parts[-1].strip() if len(parts) > 1 else 'No disponible'
         return 'No disponible'
     
-    def _extract_floor(self, soup):
+    def _extract_floor(self, doc):
         """Extrae la planta"""
-        floor = soup.find('span', string=re.compile(r'planta', re.IGNORECASE))
+        floor = doc.soup.find('span', string=re.compile(r'planta', re.IGNORECASE))
         if floor:
             match = re.search(r'(\d+)', floor.text)
             return match.group(1) if match else 'N/A'
         return 'N/A'
     
-    def _extract_exterior(self, soup):
+    def _extract_exterior(self, doc):
         """Detecta si es exterior"""
-        features = soup.find_all('span', class_='details-property-feature-text')
-        for feature in features:
-            if 'exterior' in feature.text.lower():
-                return True
-        return False
+        return doc.has_feature('exterior')
     
-    def _extract_elevator(self, soup):
+    def _extract_elevator(self, doc):
         """Detecta si tiene ascensor"""
-        features = soup.find_all('span', class_='details-property-feature-text')
-        for feature in features:
-            if 'ascensor' in feature.text.lower():
-                return True
-        return False
+        return doc.has_feature('ascensor')
     
-    def _extract_parking(self, soup):
+    def _extract_parking(self, doc):
         """Detecta si tiene parking"""
-        features = soup.find_all('span', class_='details-property-feature-text')
-        for feature in features:
-            if 'garaje' in feature.text.lower() or 'parking' in feature.text.lower():
-                return True
-        return False
+        return doc.has_feature('garaje', 'parking')
     
-    def _extract_main_image(self, soup):
+    def _extract_main_image(self, doc):
         """Extrae la imagen principal"""
-        img = soup.find('img', class_='detail-image')
+        img = doc.soup.find('img', class_='detail-image')
         if not img:
-            img = soup.find('picture')
+            img = doc.soup.find('picture')
             if img:
                 img = img.find('img')
         return img.get('src', '') if img else ''
@@ -316,11 +515,11 @@ class IdealistaScraper:
             img = item.find('img')
         return img.get('src', '') if img else ''
     
-    def _extract_description(self, soup):
+    def _extract_description(self, doc):
         """Extrae la descripción"""
-        desc = soup.find('div', class_='comment')
+        desc = doc.soup.find('div', class_='comment')
         if not desc:
-            desc = soup.find('div', {'data-test': 'description'})
+            desc = doc.soup.find('div', {'data-test': 'description'})
         return desc.text.strip()[:500] if desc else ''
     
     @staticmethod
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Tracker de varias búsquedas a la vez
+Lee las búsquedas guardadas de SEARCHES_FILE (ver searches.example.json) y
+las sondea en paralelo desde un solo proceso: los clientes (y sus sesiones
+con pool de conexiones), el estado de sondeo, los IDs vistos y la escritura
+en Google Sheets son compartidos por todas las búsquedas.
+
+Cada búsqueda indica su origen:
+- "api": API oficial o RapidAPI (según USE_RAPIDAPI), con "params" que
+  sustituyen a los de config.py (parámetros de la API oficial como center o
+  maxPrice, o argumentos de IdealistaRapidAPI.search_properties como location_id).
+  Con "sweep": true (solo API oficial) la zona se recorre entera por teselas.
+- "scraper": scraping de la "url" de una búsqueda de idealista.com
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import config
+from google_sheets import GoogleSheetsManager
+from http_client import PollStateStore
+from property_store import PropertyStore, price_drops
+from sheets_queue import SheetsWriteQueue
+
+
+def load_searches(path=None):
+    """Carga la lista de búsquedas guardadas"""
+    path = path or config.SEARCHES_FILE
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    searches = data.get('searches', []) if isinstance(data, dict) else data
+
+    for i, search in enumerate(searches, 1):
+        search.setdefault('name', f"búsqueda {i}")
+        search.setdefault('source', 'scraper' if search.get('url') else 'api')
+        if search['source'] == 'scraper' and not search.get('url'):
+            raise ValueError(f"La búsqueda '{search['name']}' es de scraping y no tiene 'url'")
+    return searches
+
+
+class MultiSearchTracker:
+    """Sondeo concurrente de varias búsquedas con clientes y escritura compartidos"""
+
+    def __init__(self, searches, max_concurrency=None):
+        self.searches = searches
+        self.max_concurrency = max_concurrency or config.MULTI_SEARCH_MAX_CONCURRENCY
+        self.sheets = GoogleSheetsManager()
+        # Un único escritor a Sheets, en segundo plano
+        self.sheets_queue = SheetsWriteQueue(self.sheets)
+        self.poll_state = PollStateStore()
+        self.seen_properties = PropertyStore()
+
+        # Un cliente de cada tipo para todas las búsquedas (sesiones con pool)
+        sources = {search['source'] for search in searches}
+        self.api_client = self._create_api_client() if 'api' in sources else None
+        self.scraper = None
+        if 'scraper' in sources:
+            from idealista_scraper import IdealistaScraper
+            self.scraper = IdealistaScraper()
+            self.scraper.poll_state = self.poll_state
+
+    @staticmethod
+    def _create_api_client():
+        """Cliente de API oficial o RapidAPI según la configuración"""
+        if config.USE_RAPIDAPI:
+            from idealista_rapidapi import IdealistaRapidAPI
+            return IdealistaRapidAPI()
+        from idealista_api import IdealistaAPI
+        return IdealistaAPI()
+
+    def _poll(self, search):
+        """
+        Sondea una búsqueda y devuelve sus propiedades ya formateadas (lista
+        vacía si no ha cambiado) y los cambios de su estado de sondeo, que se
+        aplican cuando el ciclo termina bien. Se ejecuta en un hilo del pool.
+        """
+        poll = self.poll_state.begin()
+        if search['source'] == 'scraper':
+            properties = self.scraper.poll_search(search['url'], seen_ids=self.seen_properties, poll_state=poll)
+            return properties or [], poll
+
+        if search.get('sweep') and hasattr(self.api_client, 'sweep_area_if_changed'):
+            # Barrido completo por teselas (zonas con más anuncios que el límite
+            # por búsqueda), solo si la página 1 de la zona ha cambiado
+            properties = self.api_client.sweep_area_if_changed(poll, **search.get('params', {}))
+        else:
+            properties = self.api_client.search_properties_if_changed(poll, **search.get('params', {}))
+        return [self.api_client.format_property_data(p) for p in properties or []], poll
+
+    def check_new_properties(self):
+        """Sondea todas las búsquedas y escribe las propiedades nuevas"""
+        print(f"\n🔍 Sondeando {len(self.searches)} búsqueda(s)... [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]")
+        # Una vez por ciclo: la caché de RapidAPI no crece sin límite
+        if hasattr(self.api_client, 'purge_cache'):
+            self.api_client.purge_cache()
+
+        new_properties = []
+        new_scraped = []
+        known_properties = []
+        polls = []
+        with ThreadPoolExecutor(max_workers=min(len(self.searches), self.max_concurrency)) as executor:
+            futures = {executor.submit(self._poll, search): search for search in self.searches}
+
+            # Un único escritor: el hilo principal deduplica entre búsquedas
+            for future in as_completed(futures):
+                search = futures[future]
+                try:
+                    properties, poll = future.result()
+                except Exception as e:
+                    print(f"❌ [{search['name']}] Error en la búsqueda: {e}")
+                    continue
+
+                polls.append(poll)
+                new_ids = set(self.seen_properties.add_new(prop.get('id') for prop in properties))
+                found = 0
+                for prop in properties:
+                    prop['busqueda'] = search['name']
+                    if str(prop.get('id') or '') in new_ids:
+                        # Si dos resultados de la búsqueda tienen el mismo ID, solo el primero
+                        new_ids.discard(str(prop['id']))
+                        (new_scraped if search['source'] == 'scraper' else new_properties).append(prop)
+                        found += 1
+                    else:
+                        known_properties.append(prop)
+                print(f"📋 [{search['name']}] {len(properties)} resultado(s), {found} nuevo(s)")
+
+        if new_scraped:
+            # Las de scraping se completan con su ficha (en paralelo, con tiempo máximo)
+            new_properties += self.scraper.enrich_properties(new_scraped)
+
+        if new_properties:
+            print(f"🆕 ¡{len(new_properties)} nueva(s) propiedad(es) encontrada(s)!")
+            for prop in new_properties:
+                print(f"  ➕ [{prop['busqueda']}] {prop.get('titulo', '')[:50]} - {prop.get('url', '')}")
+            self.sheets_queue.enqueue_properties(new_properties)
+            print(f"\n📥 {len(new_properties)} propiedad(es) encolada(s) para Google Sheets")
+        else:
+            print("ℹ️  No se encontraron propiedades nuevas")
+
+        # Cambios de precio de las ya conocidas (solo se comparan las que tienen otro hash)
+        changes = self.seen_properties.track_changes(new_properties + known_properties)
+        for prop, old_price, new_price in price_drops(changes):
+            drop = (old_price - new_price) / old_price * 100 if old_price else 0
+            print(f"📉 [{prop.get('busqueda', '')}] Bajada de precio: {prop.get('titulo', '')[:50]} "
+                  f"{old_price:,.0f}€ → {new_price:,.0f}€ (-{drop:.1f}%) {prop.get('url', '')}")
+
+        # Solo las búsquedas que han ido bien guardan su estado de sondeo
+        for poll in polls:
+            poll.commit()
+        self.poll_state.save()
+        return len(new_properties)
+
+    def _next_wait_seconds(self):
+        """Intervalo hasta el próximo ciclo (ajustado a la cuota si se usa RapidAPI)"""
+        if hasattr(self.api_client, 'next_poll_interval'):
+            api_searches = sum(1 for s in self.searches if s['source'] == 'api')
+            return self.api_client.next_poll_interval(calls_per_poll=max(1, api_searches))
+        return config.CHECK_INTERVAL_MINUTES * 60
+
+    def run_continuous(self):
+        """Ejecuta el tracker continuamente"""
+        print(f"🚀 Iniciando tracker de {len(self.searches)} búsqueda(s)")
+        print(f"📊 Google Sheets: {self.sheets.get_spreadsheet_url()}")
+        print("\n" + "="*60)
+
+        # Inicializar la hoja de cálculo
+        self.sheets.get_or_create_spreadsheet()
+        self.sheets_queue.start()
+
+        try:
+            while True:
+                self.check_new_properties()
+
+                wait_seconds = self._next_wait_seconds()
+                print(f"\n⏳ Esperando {wait_seconds / 60:.0f} minutos hasta la próxima comprobación...")
+                print("   (Presiona Ctrl+C para detener)")
+                time.sleep(wait_seconds)
+
+        except KeyboardInterrupt:
+            print("\n\n🛑 Tracker detenido por el usuario")
+            print(f"📊 Propiedades rastreadas: {len(self.seen_properties)}")
+            self.sheets_queue.close()
+
+    def run_once(self):
+        """Ejecuta un solo ciclo de todas las búsquedas"""
+        self.sheets.get_or_create_spreadsheet()
+        self.sheets_queue.start()
+        new_count = self.check_new_properties()
+        self.sheets_queue.close()
+        print(f"\n✅ Búsquedas completadas. {new_count} nueva(s) propiedad(es)")
+        return new_count
+
+
+def main():
+    """Función principal"""
+    args = sys.argv[1:]
+    mode = 'once' if 'once' in args else 'continuous'
+    args = [a for a in args if a != 'once']
+    path = args[0] if args else config.SEARCHES_FILE
+
+    if not os.path.exists(path):
+        print(f"❌ No existe el fichero de búsquedas: {path}")
+        print("   Copia searches.example.json a searches.json y edítalo")
+        print()
+        print("Uso:")
+        print("  python multi_tracker.py [searches.json] [once]")
+        return
+
+    tracker = MultiSearchTracker(load_searches(path))
+
+    if mode == 'once':
+        tracker.run_once()
+    else:
+        tracker.run_continuous()
+
+
+if __name__ == '__main__':
+    main()
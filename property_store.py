@@ -0,0 +1,276 @@
+"""
+Almacén de propiedades vistas (SQLite en modo WAL)
+Sustituye a seen_properties.json: cada ciclo solo escribe las propiedades
+de ese ciclo (altas nuevas y fecha de última vez vista), y varios trackers
+pueden usar el mismo fichero a la vez.
+
+También guarda el último registro normalizado de cada propiedad con un
+hash de sus campos seguidos: solo las que cambian de hash se comparan campo
+a campo, y los cambios se añaden a un historial que nunca se reescribe.
+
+Las comprobaciones de "¿ya visto?" son búsquedas por clave primaria en
+SQLite, así que ven al momento las altas de cualquier proceso. Con
+SEEN_TTL_DAYS > 0, un ID que lleva más de esos días sin aparecer cuenta
+como nuevo otra vez (anuncio republicado); por defecto no caduca nunca.
+
+Las propiedades se identifican por origen (portal) e ID. Todos los clientes
+actuales (API oficial, RapidAPI y scraping) usan el código de Idealista,
+así que comparten el origen 'idealista' y no se repiten entre trackers.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import config
+
+
+DEFAULT_SOURCE = 'idealista'
+
+# Campos cuyo cambio se registra en el historial (los clientes de RapidAPI
+# usan 'tamano'/'banos'). El título no: difiere entre listado y ficha.
+TRACKED_FIELDS = ('precio', 'tamaño', 'tamano', 'habitaciones', 'baños', 'banos', 'planta')
+PLACEHOLDERS = (None, '', 'N/A', 'No disponible')
+
+
+def normalize_record(record):
+    """Campos seguidos con valor real (los de relleno del listado se ignoran)"""
+    return {
+        field: record[field] for field in TRACKED_FIELDS
+        if field in record and record[field] not in PLACEHOLDERS and record[field] != 0
+    }
+
+
+def record_fingerprint(normalized):
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def price_drops(changes):
+    """Bajadas de precio entre los cambios de track_changes: [(registro, antes, ahora)]"""
+    return [
+        (record, diff['precio'][0], diff['precio'][1])
+        for record, diff in changes
+        if 'precio' in diff and diff['precio'][1] < diff['precio'][0]
+    ]
+
+
+class PropertyStore:
+    """IDs de propiedades vistas con la primera y la última vez que se vieron"""
+
+    def __init__(self, path=None, source=DEFAULT_SOURCE, migrate_from=None, ttl_days=None):
+        """
+        Args:
+            path: Fichero SQLite (default: config.PROPERTY_STORE_FILE)
+            source: Origen de los IDs
+            migrate_from: seen_properties.json antiguo a importar
+                          (default: config.SEEN_PROPERTIES_FILE)
+            ttl_days: Días sin ver un ID para que vuelva a contar como nuevo
+                      (default: config.SEEN_TTL_DAYS, 0 = nunca caduca)
+        """
+        self.path = path or config.PROPERTY_STORE_FILE
+        self.source = source
+        self.ttl = (ttl_days if ttl_days is not None else config.SEEN_TTL_DAYS) * 86400
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS properties (
+                source TEXT NOT NULL,
+                id TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (source, id)
+            ) WITHOUT ROWID
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(properties)')}
+        if 'fingerprint' not in columns:
+            self._conn.execute('ALTER TABLE properties ADD COLUMN fingerprint TEXT')
+            self._conn.execute('ALTER TABLE properties ADD COLUMN record TEXT')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS property_history (
+                source TEXT NOT NULL,
+                id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                old_value TEXT,
+                new_value TEXT,
+                changed_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_history_property ON property_history (source, id, changed_at)'
+        )
+
+        self.migrate_json(migrate_from or config.SEEN_PROPERTIES_FILE)
+
+    def _cutoff(self):
+        """last_seen mínimo para que un ID siga contando como visto"""
+        return time.time() - self.ttl if self.ttl > 0 else 0
+
+    def __contains__(self, property_id):
+        """¿ID ya visto (dentro del TTL)? Búsqueda por clave primaria"""
+        property_id = str(property_id)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM properties WHERE source = ? AND id = ? AND last_seen >= ?',
+                (self.source, property_id, self._cutoff()),
+            ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM properties WHERE source = ?', (self.source,)
+            ).fetchone()[0]
+
+    def add_new(self, property_ids):
+        """
+        Registra los IDs vistos en este ciclo y devuelve los que no se
+        habían visto nunca (en el mismo orden). Los ya conocidos solo
+        actualizan su last_seen.
+        """
+        ids = list(dict.fromkeys(str(pid) for pid in property_ids if pid))
+        if not ids:
+            return []
+
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE: otro tracker no puede dar de alta los mismos IDs a la vez
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                known = set()
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    known.update(row[0] for row in self._conn.execute(
+                        f'SELECT id FROM properties WHERE source = ? AND last_seen >= ? AND id IN ({placeholders})',
+                        (self.source, self._cutoff(), *chunk),
+                    ))
+
+                self._conn.executemany(
+                    '''INSERT INTO properties (source, id, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                       ON CONFLICT (source, id) DO UPDATE SET last_seen = excluded.last_seen''',
+                    [(self.source, pid, now, now) for pid in ids],
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        return [pid for pid in ids if pid not in known]
+
+    def track_changes(self, records):
+        """
+        Compara los registros de este ciclo con los guardados.
+
+        Solo se leen y comparan los que tienen otro hash; los cambios de sus
+        campos se añaden a property_history. Los registros sin datos previos
+        se guardan sin generar historial.
+
+        Args:
+            records: Propiedades formateadas (con 'id')
+
+        Returns:
+            list: (registro, {campo: (antes, ahora)}) de las que han cambiado
+        """
+        incoming = {}
+        for record in records:
+            if record and record.get('id'):
+                normalized = normalize_record(record)
+                if normalized:
+                    incoming[str(record['id'])] = (record, normalized, record_fingerprint(normalized))
+        if not incoming:
+            return []
+
+        now = time.time()
+        changes = []
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                ids = list(incoming)
+                stored = {}
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    for pid, fingerprint in self._conn.execute(
+                        f'SELECT id, fingerprint FROM properties WHERE source = ? AND id IN ({placeholders})',
+                        (self.source, *chunk),
+                    ):
+                        stored[pid] = fingerprint
+
+                for pid, (record, normalized, fingerprint) in incoming.items():
+                    if pid in stored and stored[pid] == fingerprint:
+                        continue
+
+                    previous = {}
+                    if stored.get(pid):
+                        row = self._conn.execute(
+                            'SELECT record FROM properties WHERE source = ? AND id = ?', (self.source, pid)
+                        ).fetchone()
+                        previous = json.loads(row[0]) if row and row[0] else {}
+
+                    diff = {
+                        field: (previous[field], value) for field, value in normalized.items()
+                        if field in previous and previous[field] != value
+                    }
+                    if diff:
+                        self._conn.executemany(
+                            'INSERT INTO property_history (source, id, field, old_value, new_value, changed_at) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            [(self.source, pid, field, json.dumps(old), json.dumps(new), now)
+                             for field, (old, new) in diff.items()],
+                        )
+                        changes.append((record, diff))
+
+                    # Los campos que faltan en este registro se conservan del anterior
+                    merged = {**previous, **normalized}
+                    self._conn.execute(
+                        '''INSERT INTO properties (source, id, first_seen, last_seen, fingerprint, record)
+                           VALUES (?, ?, ?, ?, ?, ?)
+                           ON CONFLICT (source, id) DO UPDATE SET
+                               last_seen = excluded.last_seen,
+                               fingerprint = excluded.fingerprint,
+                               record = excluded.record''',
+                        (self.source, pid, now, now, fingerprint, json.dumps(merged, ensure_ascii=False)),
+                    )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        return changes
+
+    def price_history(self, property_id):
+        """Cambios de precio de una propiedad: [(timestamp, antes, ahora)]"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT changed_at, old_value, new_value FROM property_history '
+                'WHERE source = ? AND id = ? AND field = ? ORDER BY changed_at',
+                (self.source, str(property_id), 'precio'),
+            ).fetchall()
+        return [(changed_at, json.loads(old), json.loads(new)) for changed_at, old, new in rows]
+
+    def migrate_json(self, json_path):
+        """Importa un seen_properties.json antiguo y lo renombra a .migrated"""
+        if not json_path or not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, 'r') as f:
+                seen_ids = json.load(f).get('seen_ids', [])
+        except Exception as e:
+            print(f"⚠️  Error leyendo {json_path} para migrarlo: {e}")
+            return 0
+
+        added = self.add_new(seen_ids)
+        try:
+            os.replace(json_path, f"{json_path}.migrated")
+        except FileNotFoundError:
+            # Otro tracker lo ha migrado a la vez
+            pass
+        print(f"📦 {len(added)} propiedad(es) vistas migradas de {json_path} a {self.path}")
+        return len(added)
@@ -0,0 +1,183 @@
+"""
+Presupuesto de llamadas a RapidAPI
+- QuotaLedger: registro persistente de la cuota del plan, actualizado con
+  las cabeceras X-RateLimit-* de cada respuesta
+- QuotaScheduler: reparte las llamadas restantes hasta el fin del periodo
+  de facturación. La página 1 de cada búsqueda va primero; las páginas
+  siguientes y las fichas de detalle solo gastan el margen que sobra
+  respecto al ritmo previsto.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+import config
+
+
+# Prioridades, de más a menos importante
+FIRST_PAGE = 'first_page'
+DEEP_PAGE = 'deep_page'
+DETAIL = 'detail'
+
+# Cabeceras de RapidAPI (las genéricas como alternativa)
+LIMIT_HEADERS = ('X-RateLimit-Requests-Limit', 'X-RateLimit-Limit')
+REMAINING_HEADERS = ('X-RateLimit-Requests-Remaining', 'X-RateLimit-Remaining')
+RESET_HEADERS = ('X-RateLimit-Requests-Reset', 'X-RateLimit-Reset')
+
+
+def _header_int(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return int(float(value))
+            except ValueError:
+                pass
+    return None
+
+
+class QuotaLedger:
+    """Cuota del plan (límite, restantes, fin del periodo) guardada en JSON"""
+
+    def __init__(self, path=None, period_days=None):
+        self.path = path or config.RAPIDAPI_QUOTA_FILE
+        self.period = (period_days or config.RAPIDAPI_QUOTA_PERIOD_DAYS) * 86400
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"⚠️  Error cargando cuota de RapidAPI: {e}")
+        return {}
+
+    def save(self):
+        """Guarda el registro en disco"""
+        with self._lock:
+            try:
+                with open(self.path, 'w') as f:
+                    json.dump(self._state, f, indent=2)
+            except Exception as e:
+                print(f"❌ Error guardando cuota de RapidAPI: {e}")
+
+    def record(self, priority, headers):
+        """Anota una llamada y actualiza la cuota con las cabeceras de la respuesta"""
+        now = time.time()
+        limit = _header_int(headers, LIMIT_HEADERS)
+        remaining = _header_int(headers, REMAINING_HEADERS)
+        reset = _header_int(headers, RESET_HEADERS)
+
+        with self._lock:
+            state = self._state
+            if state.get('reset_at') and now >= state['reset_at']:
+                # Nuevo periodo: los contadores empiezan de cero
+                state['calls'] = {}
+                state.pop('remaining', None)
+                # Tras una parada larga pueden haber pasado varios periodos
+                elapsed = int((now - state['reset_at']) // self.period) + 1
+                state['reset_at'] = state['reset_at'] + elapsed * self.period
+
+            if limit is not None:
+                state['limit'] = limit
+            if remaining is not None:
+                state['remaining'] = remaining
+            elif state.get('remaining'):
+                state['remaining'] -= 1
+            if reset is not None:
+                # RapidAPI envía los segundos que faltan para el reinicio
+                state['reset_at'] = now + reset if reset < self.period * 2 else reset
+            elif not state.get('reset_at'):
+                state['reset_at'] = now + self.period
+
+            calls = state.setdefault('calls', {})
+            calls[priority] = calls.get(priority, 0) + 1
+            state['updated_at'] = now
+
+        self.save()
+
+    def snapshot(self):
+        """(límite, restantes, segundos hasta el reinicio); None si aún no se conocen"""
+        with self._lock:
+            limit = self._state.get('limit')
+            remaining = self._state.get('remaining')
+            reset_at = self._state.get('reset_at')
+        if limit is None or remaining is None or reset_at is None:
+            return None
+        time_left = reset_at - time.time()
+        if time_left <= 0:
+            # El periodo terminó: la cuota completa vuelve a estar disponible
+            return limit, limit, self.period
+        return limit, remaining, time_left
+
+
+class QuotaScheduler:
+    """
+    Reparte la cuota restante a lo largo del periodo.
+
+    El ritmo previsto es lineal: a falta de `t` segundos deberían quedar
+    `limit * t / periodo` llamadas. La página 1 siempre se permite mientras
+    quede cuota y se sondea a un intervalo calculado para gastar
+    (1 - reserve_share) de lo restante; el resto (el margen sobre el ritmo
+    previsto) se destina a páginas siguientes y, después, a fichas de detalle.
+    """
+
+    def __init__(self, ledger, min_interval=None, max_interval=None, reserve_share=None):
+        self.ledger = ledger
+        self.min_interval = min_interval if min_interval is not None else config.RAPIDAPI_MIN_POLL_SECONDS
+        self.max_interval = max_interval if max_interval is not None else config.RAPIDAPI_MAX_POLL_SECONDS
+        self.reserve_share = reserve_share if reserve_share is not None else config.RAPIDAPI_QUOTA_RESERVE_SHARE
+
+    def _slack(self):
+        """Llamadas por encima del ritmo previsto (None si no hay datos de cuota)"""
+        snapshot = self.ledger.snapshot()
+        if snapshot is None:
+            return None
+        limit, remaining, time_left = snapshot
+        on_pace = limit * min(1.0, time_left / self.ledger.period)
+        return remaining, remaining - on_pace, limit
+
+    def affordable(self, priority, wanted):
+        """Cuántas de las `wanted` llamadas de esta prioridad caben ahora en el presupuesto"""
+        slack = self._slack()
+        if slack is None:
+            return wanted
+        remaining, over_pace, limit = slack
+
+        if remaining <= 0:
+            return 0
+        if priority == FIRST_PAGE:
+            return min(wanted, remaining)
+        if priority == DETAIL:
+            # Las fichas ceden ante las páginas: dejan un pequeño colchón
+            over_pace -= max(1, limit * 0.01)
+        return max(0, min(wanted, remaining - 1, math.floor(over_pace)))
+
+    def allow(self, priority):
+        return self.affordable(priority, 1) > 0
+
+    def next_interval(self, calls_per_poll=1):
+        """Segundos hasta el próximo sondeo para no agotar la cuota antes del reinicio"""
+        snapshot = self.ledger.snapshot()
+        if snapshot is None:
+            return config.CHECK_INTERVAL_MINUTES * 60
+        _, remaining, time_left = snapshot
+
+        polls_left = remaining * (1 - self.reserve_share) / max(1, calls_per_poll)
+        if polls_left < 1:
+            # Sin cuota: esperar al reinicio del periodo
+            return min(self.max_interval, max(self.min_interval, time_left))
+        return min(self.max_interval, max(self.min_interval, time_left / polls_left))
+
+    def summary(self):
+        snapshot = self.ledger.snapshot()
+        if snapshot is None:
+            return "cuota: sin datos todavía"
+        limit, remaining, time_left = snapshot
+        return (f"cuota: {remaining}/{limit} llamadas restantes, "
+                f"reinicio en {time_left / 86400:.1f} días")
@@ -0,0 +1,223 @@
+"""
+Control de ritmo y reintentos para las peticiones HTTP
+- TokenBucket: N peticiones por segundo con ráfagas
+- RetryPolicy: backoff exponencial con jitter y respeto de Retry-After
+- AdaptiveHostController: ritmo y concurrencia por dominio que se reducen
+  ante respuestas de throttling (429/503) y se recuperan con los éxitos
+- request_with_retry: une las tres piezas alrededor de session.request
+
+No depende de config.py para poder usarse también desde api/server.py.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+
+class TokenBucket:
+    """Token bucket: `rate` peticiones por segundo con ráfagas de hasta `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloquea hasta que haya un token disponible"""
+        while True:
+            with self._lock:
+                if self.rate <= 0:
+                    return
+
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def parse_retry_after(value):
+    """Convierte la cabecera Retry-After (segundos o fecha HTTP) en segundos"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Reintentos con backoff exponencial, jitter y Retry-After"""
+
+    def __init__(self, max_retries=3, base_delay=1.0, max_delay=60.0, statuses=RETRY_STATUSES):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statuses = statuses
+
+    def should_retry(self, response=None, error=None):
+        if error is not None:
+            return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+        return response is not None and response.status_code in self.statuses
+
+    def delay(self, attempt, response=None):
+        """Segundos a esperar antes del reintento número `attempt` (desde 0)"""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(self.max_delay, retry_after)
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        # Jitter: entre la mitad y el total, para no sincronizar reintentos
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class _HostState:
+    def __init__(self, rate, burst, concurrency):
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.cooldown_until = 0.0
+
+
+class AdaptiveHostController:
+    """
+    Ritmo (peticiones/s) y concurrencia adaptativos por dominio (AIMD):
+    ante un 429/503 se reducen a la mitad y se respeta Retry-After;
+    tras `increase_after` éxitos seguidos se suben un escalón.
+    """
+
+    def __init__(self, rate=0, burst=1, max_concurrency=4, max_rate=None,
+                 min_rate=None, increase_after=10):
+        """
+        Args:
+            rate: Ritmo inicial por dominio (0 = sin límite de ritmo, solo concurrencia)
+            burst: Tamaño máximo de ráfaga
+            max_concurrency: Peticiones simultáneas máximas por dominio
+            max_rate: Ritmo máximo al que se puede subir (default: el inicial)
+            min_rate: Ritmo mínimo tras reducir (default: inicial / 16)
+            increase_after: Éxitos seguidos necesarios para subir un escalón
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.increase_after = increase_after
+        self._hosts = {}
+        self._cond = threading.Condition()
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = _HostState(self.rate, self.burst, self.max_concurrency)
+            self._hosts[host] = state
+        return state
+
+    def acquire(self, url):
+        """Espera turno para el dominio de `url` (concurrencia, pausa y ritmo)"""
+        host = urlparse(url).netloc
+        with self._cond:
+            state = self._state(host)
+            while True:
+                wait = state.cooldown_until - time.monotonic()
+                if wait <= 0 and state.in_flight < state.limit:
+                    break
+                self._cond.wait(timeout=wait if wait > 0 else None)
+            state.in_flight += 1
+        state.bucket.acquire()
+
+    def release(self, url, status=None, retry_after=None, error=False):
+        """Registra el resultado de la petición y ajusta el dominio"""
+        host = urlparse(url).netloc
+        with self._cond:
+            state = self._state(host)
+            state.in_flight -= 1
+
+            if status in THROTTLE_STATUSES:
+                state.successes = 0
+                state.limit = max(1, state.limit // 2)
+                if state.bucket.rate > 0:
+                    state.bucket.rate = max(self.min_rate, state.bucket.rate / 2)
+                if retry_after:
+                    state.cooldown_until = max(state.cooldown_until, time.monotonic() + retry_after)
+                print(f"🐢 {host}: throttling ({status}), bajando a {state.limit} simultánea(s)"
+                      + (f" y {state.bucket.rate:.2f} pet/s" if state.bucket.rate > 0 else ''))
+
+            elif error or (status is not None and status >= 500):
+                state.successes = 0
+
+            elif status is not None:
+                state.successes += 1
+                if state.successes >= self.increase_after:
+                    state.successes = 0
+                    state.limit = min(self.max_concurrency, state.limit + 1)
+                    if state.bucket.rate > 0:
+                        state.bucket.rate = min(self.max_rate, state.bucket.rate * 1.25)
+
+            self._cond.notify_all()
+
+
+def request_with_retry(session, method, url, policy=None, controller=None, **kwargs):
+    """
+    session.request(method, url, **kwargs) con reintentos ante errores de red
+    y respuestas 429/5xx. Si no quedan reintentos devuelve la última respuesta
+    (o relanza el último error de red), igual que una llamada normal.
+    """
+    policy = policy or RetryPolicy()
+    attempt = 0
+
+    while True:
+        if controller:
+            controller.acquire(url)
+
+        response = None
+        error = None
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            error = e
+        finally:
+            if controller:
+                controller.release(
+                    url,
+                    status=response.status_code if response is not None else None,
+                    retry_after=parse_retry_after(response.headers.get('Retry-After')) if response is not None else None,
+                    error=error is not None,
+                )
+
+        if attempt >= policy.max_retries or not policy.should_retry(response, error):
+            if error is not None:
+                raise error
+            return response
+
+        delay = policy.delay(attempt, response)
+        reason = response.status_code if response is not None else type(error).__name__
+        print(f"⏳ {urlparse(url).netloc}: {reason}, reintento {attempt + 1}/{policy.max_retries} en {delay:.1f}s")
+        if response is not None:
+            response.close()
+        time.sleep(delay)
+        attempt += 1
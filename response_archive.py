@@ -0,0 +1,236 @@
+"""
+Archivo local de respuestas HTTP (tipo WARC) con modo grabación y reproducción
+Cada respuesta se guarda comprimida (zstd si está instalado, si no zlib) al
+final de un fichero de datos que solo crece, con un índice JSONL por URL y
+fecha. En modo 'replay' las sesiones responden desde el archivo sin tocar
+la red, para perfilar los parsers o reproducir un parseo incorrecto.
+
+Modos: 'off' (por defecto), 'record' (red + guardar), 'replay' (solo archivo)
+
+Los tokens OAuth de las respuestas (access_token, refresh_token...) se
+guardan sustituidos por REDACTED: el archivo no contiene credenciales y las
+peticiones siguientes se reproducen igual (la clave no incluye cabeceras).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+DATA_FILE = 'responses.dat'
+INDEX_FILE = 'index.jsonl'
+SECRET_FIELDS = ('access_token', 'refresh_token', 'id_token')
+REDACTED = 'REDACTED'
+
+
+def request_key(method, url, body=None):
+    """Clave estable de una petición: método, URL con la query ordenada y hash del cuerpo"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    key = f"{method.upper()} {urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))}"
+    if body:
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        key += f" {hashlib.sha1(body).hexdigest()}"
+    return key
+
+
+def redact_body(body):
+    """Cuerpo JSON con los tokens sustituidos por REDACTED (el resto, sin tocar)"""
+    if not body or not any(field.encode() in body for field in SECRET_FIELDS):
+        return body
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    if not isinstance(data, dict):
+        return body
+    for field in SECRET_FIELDS:
+        if field in data:
+            data[field] = REDACTED
+    return json.dumps(data).encode('utf-8')
+
+
+class ResponseArchive:
+    """Fichero de respuestas comprimidas + índice por clave de petición"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.data_path = os.path.join(directory, DATA_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.codec = 'zstd' if HAS_ZSTD else 'zlib'
+        self._lock = threading.Lock()
+        self._index = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _compress(self, payload):
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=10).compress(payload)
+        return zlib.compress(payload, 6)
+
+    @staticmethod
+    def _decompress(data, codec):
+        if codec == 'zstd':
+            if not HAS_ZSTD:
+                raise RuntimeError("El archivo usa zstd: pip install zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def record(self, method, url, request_body, status, headers, body):
+        """Añade una respuesta al final del archivo"""
+        meta = {
+            'method': method.upper(),
+            'url': url,
+            'status': status,
+            'headers': dict(headers),
+        }
+        payload = json.dumps(meta, ensure_ascii=False).encode('utf-8') + b'\n' + (redact_body(body) or b'')
+        compressed = self._compress(payload)
+
+        entry = {
+            'key': request_key(method, url, request_body),
+            'url': url,
+            'status': status,
+            'timestamp': time.time(),
+            'codec': self.codec,
+            'length': len(compressed),
+        }
+
+        with self._lock:
+            with open(self.data_path, 'ab') as data_file:
+                entry['offset'] = data_file.seek(0, os.SEEK_END)
+                data_file.write(compressed)
+            with open(self.index_path, 'a') as index_file:
+                index_file.write(json.dumps(entry) + '\n')
+            if self._index is not None:
+                self._index.setdefault(entry['key'], []).append(entry)
+
+    def _load_index(self):
+        with self._lock:
+            if self._index is None:
+                index = {}
+                if os.path.exists(self.index_path):
+                    with open(self.index_path, 'r') as f:
+                        for line in f:
+                            if line.strip():
+                                entry = json.loads(line)
+                                index.setdefault(entry['key'], []).append(entry)
+                self._index = index
+            return self._index
+
+    def read(self, entry):
+        """Devuelve (meta, cuerpo) de una entrada del índice"""
+        with open(self.data_path, 'rb') as f:
+            f.seek(entry['offset'])
+            data = f.read(entry['length'])
+        payload = self._decompress(data, entry['codec'])
+        header, _, body = payload.partition(b'\n')
+        return json.loads(header), body
+
+    def lookup(self, method, url, request_body=None, at=None):
+        """
+        Busca la respuesta archivada de una petición: la más reciente,
+        o la última anterior a `at` (timestamp) si se indica
+        """
+        entries = self._load_index().get(request_key(method, url, request_body), [])
+        if at is not None:
+            entries = [e for e in entries if e['timestamp'] <= at]
+        if not entries:
+            return None
+        return self.read(max(entries, key=lambda e: e['timestamp']))
+
+    def iter_responses(self, url_contains=None, status=200):
+        """Recorre las respuestas archivadas (para re-ejecutar parsers sin red)"""
+        for entries in self._load_index().values():
+            for entry in entries:
+                if url_contains and url_contains not in entry['url']:
+                    continue
+                if status is not None and entry['status'] != status:
+                    continue
+                meta, body = self.read(entry)
+                yield meta, body
+
+
+class ArchiveAdapter(HTTPAdapter):
+    """Adaptador de requests que graba las respuestas o las sirve desde el archivo"""
+
+    def __init__(self, archive, mode, **kwargs):
+        self.archive = archive
+        self.mode = mode
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.mode == 'replay':
+            archived = self.archive.lookup(request.method, request.url, request.body)
+            if archived is None:
+                raise requests.exceptions.ConnectionError(
+                    f"Sin respuesta archivada para {request.method} {request.url}", request=request
+                )
+            return self._build_archived_response(request, *archived)
+
+        response = super().send(request, **kwargs)
+        if self.mode == 'record':
+            self.archive.record(request.method, request.url, request.body,
+                                response.status_code, response.headers, response.content)
+        return response
+
+    @staticmethod
+    def _build_archived_response(request, meta, body):
+        response = requests.Response()
+        response.status_code = meta['status']
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.reason = 'Archived'
+        response._content = body
+        response._content_consumed = True
+        return response
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(directory):
+    """Un único ResponseArchive por directorio dentro del proceso"""
+    with _archives_lock:
+        if directory not in _archives:
+            _archives[directory] = ResponseArchive(directory)
+        return _archives[directory]
+
+
+def create_adapter(mode='off', directory='http_archive', **adapter_kwargs):
+    """Adaptador HTTP para una sesión: normal, o con grabación/reproducción"""
+    if mode in ('record', 'replay'):
+        return ArchiveAdapter(get_archive(directory), mode, **adapter_kwargs)
+    return HTTPAdapter(**adapter_kwargs)
+
+
+def serves_from_archive(session, url):
+    """¿La sesión responde a `url` desde el archivo (modo replay), sin red?"""
+    adapter = session.get_adapter(url)
+    return isinstance(adapter, ArchiveAdapter) and adapter.mode == 'replay'
+
+
+def mount_adapter(session, mode='off', directory='http_archive', **adapter_kwargs):
+    """Monta el adaptador en http:// y https:// de la sesión"""
+    adapter = create_adapter(mode, directory, **adapter_kwargs)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -0,0 +1,117 @@
+"""
+Caché persistente de respuestas JSON (SQLite)
+Pensada para las APIs de pago por llamada: cada entrada guarda el momento
+en que se obtuvo, y quien la usa decide su TTL y su ventana de
+stale-while-revalidate (servir la copia caducada mientras se refresca).
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """Caché clave → JSON con marca de tiempo y estadísticas de uso"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0}
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                value TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, key):
+        """Devuelve (valor, edad en segundos) o (None, None)"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, stored_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), time.time() - row[1]
+
+    def set(self, key, endpoint, value):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, endpoint, value, stored_at) VALUES (?, ?, ?, ?)',
+                (key, endpoint, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+    def purge(self, max_age, endpoint=None):
+        """Borra las entradas más antiguas que `max_age` segundos (de `endpoint` o de todos)"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            if endpoint is None:
+                cursor = self._conn.execute('DELETE FROM responses WHERE stored_at < ?', (cutoff,))
+            else:
+                cursor = self._conn.execute(
+                    'DELETE FROM responses WHERE endpoint = ? AND stored_at < ?', (endpoint, cutoff)
+                )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def get_or_fetch(self, key, endpoint, fetch, ttl, stale_ttl=0):
+        """
+        Devuelve el valor cacheado si tiene menos de `ttl` segundos.
+        Entre `ttl` y `ttl + stale_ttl` lo devuelve igualmente y lo refresca
+        en segundo plano. Si no hay copia válida, llama a `fetch()` y la guarda.
+        """
+        value, age = self.get(key)
+
+        if value is not None and age < ttl:
+            self._count('hits')
+            return value
+
+        if value is not None and age < ttl + stale_ttl:
+            self._count('stale')
+            self._refresh_in_background(key, endpoint, fetch)
+            return value
+
+        self._count('misses')
+        value = fetch()
+        if value is not None:
+            self.set(key, endpoint, value)
+        return value
+
+    def _refresh_in_background(self, key, endpoint, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = fetch()
+                if value is not None:
+                    self.set(key, endpoint, value)
+            except Exception as e:
+                print(f"⚠️  Error refrescando caché ({endpoint}): {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def summary(self):
+        """Resumen de aciertos/fallos para mostrar por consola"""
+        total = sum(self.stats.values())
+        hit_rate = (self.stats['hits'] + self.stats['stale']) / total * 100 if total else 0
+        return (f"caché: {self.stats['hits']} aciertos, {self.stats['stale']} caducados, "
+                f"{self.stats['misses']} fallos ({hit_rate:.0f}% sin llamar a la API)")
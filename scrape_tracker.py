@@ -4,12 +4,12 @@ Tracker automático usando scraping (sin API)
 Scrapea la página de búsqueda de Idealista periódicamente
 """
 
-import json
-import os
 import time
 from datetime import datetime
 from idealista_scraper import IdealistaScraper
 from google_sheets import GoogleSheetsManager
+from property_store import PropertyStore, price_drops
+from sheets_queue import SheetsWriteQueue
 import config
 
 
@@ -25,32 +25,9 @@ class ScraperTracker:
         self.search_url = search_url
         self.scraper = IdealistaScraper()
         self.sheets = GoogleSheetsManager()
-        self.seen_properties_file = config.SEEN_PROPERTIES_FILE
-        self.seen_properties = self._load_seen_properties()
-        
-    def _load_seen_properties(self):
-        """Carga el conjunto de propiedades ya vistas"""
-        if os.path.exists(self.seen_properties_file):
-            try:
-                with open(self.seen_properties_file, 'r') as f:
-                    data = json.load(f)
-                    return set(data.get('seen_ids', []))
-            except Exception as e:
-                print(f"⚠️  Error cargando propiedades vistas: {e}")
-                return set()
-        return set()
-    
-    def _save_seen_properties(self):
-        """Guarda el conjunto de propiedades vistas"""
-        try:
-            with open(self.seen_properties_file, 'w') as f:
-                json.dump({
-                    'seen_ids': list(self.seen_properties),
-                    'last_updated': datetime.now().isoformat(),
-                    'search_url': self.search_url
-                }, f, indent=2)
-        except Exception as e:
-            print(f"❌ Error guardando propiedades vistas: {e}")
+        # Escrituras a Sheets en segundo plano: el tracker no espera a la API
+        self.sheets_queue = SheetsWriteQueue(self.sheets)
+        self.seen_properties = PropertyStore()
     
     def check_new_properties(self):
         """Busca nuevas propiedades mediante scraping"""
@@ -58,52 +35,51 @@ class ScraperTracker:
         print(f"📍 URL: {self.search_url}")
         
         try:
-            # Scrapear la página de búsqueda
-            properties = self.scraper.scrape_search_results(self.search_url)
+            # Scrapear las páginas de búsqueda hasta llegar a propiedades ya vistas.
+            # Validadores y hash nuevos solo se guardan si el ciclo termina bien
+            poll = self.scraper.poll_state.begin()
+            properties = self.scraper.poll_search(self.search_url, seen_ids=self.seen_properties, poll_state=poll)
+            if properties is None:
+                # La primera página no ha cambiado: nada que procesar
+                return 0
             print(f"📋 Se encontraron {len(properties)} propiedades en total")
             
-            # Filtrar propiedades nuevas
-            new_properties = []
-            for prop in properties:
-                property_id = prop['id']
-                if property_id and str(property_id) not in self.seen_properties:
-                    new_properties.append(prop)
-                    self.seen_properties.add(str(property_id))
+            # Filtrar propiedades nuevas (y registrar las vistas en este ciclo)
+            new_ids = set(self.seen_properties.add_new(prop['id'] for prop in properties))
+            new_properties = [prop for prop in properties if str(prop['id']) in new_ids]
             
             if new_properties:
                 print(f"🆕 ¡{len(new_properties)} nueva(s) propiedad(es) encontrada(s)!")
                 
-                # Para cada propiedad nueva, scrapear detalles completos
-                added_count = 0
+                # Completar con los detalles de la ficha (en paralelo, con tiempo máximo)
+                new_properties = self.scraper.enrich_properties(new_properties)
+                
                 for i, prop in enumerate(new_properties, 1):
                     print(f"\n  [{i}/{len(new_properties)}] Nueva propiedad:")
                     print(f"     ID: {prop['id']}")
                     print(f"     Título: {prop['titulo'][:50]}...")
                     print(f"     Precio: {prop['precio']:,.0f}€")
                     print(f"     URL: {prop['url']}")
-                    
-                    # Obtener detalles completos (opcional, más lento pero más datos)
-                    # detailed_prop = self.scraper.scrape_property_url(prop['url'])
-                    # if detailed_prop:
-                    #     prop = detailed_prop
-                    
-                    # Añadir a Google Sheets
-                    if self.sheets.add_property(prop):
-                        added_count += 1
-                        print(f"     ✅ Añadida a Google Sheets")
-                    
-                    # Delay entre propiedades
-                    if i < len(new_properties):
-                        time.sleep(1)
                 
-                print(f"\n✅ {added_count} propiedad(es) añadida(s) a Google Sheets")
+                # Encolar para Google Sheets (se escriben en bloque en segundo plano)
+                self.sheets_queue.enqueue_properties(new_properties)
                 
-                # Guardar IDs vistos
-                self._save_seen_properties()
+                print(f"\n📥 {len(new_properties)} propiedad(es) encolada(s) para Google Sheets")
                 
             else:
                 print("ℹ️  No se encontraron propiedades nuevas")
             
+            # Cambios de precio de las ya conocidas (las nuevas, con los datos de su ficha)
+            known_properties = [prop for prop in properties if str(prop['id']) not in new_ids]
+            changes = self.seen_properties.track_changes(new_properties + known_properties)
+            for prop, old_price, new_price in price_drops(changes):
+                drop = (old_price - new_price) / old_price * 100 if old_price else 0
+                print(f"\n📉 ¡Bajada de precio! {prop['titulo'][:50]}")
+                print(f"     {old_price:,.0f}€ → {new_price:,.0f}€ (-{drop:.1f}%)")
+                print(f"     URL: {prop['url']}")
+            
+            poll.commit()
+            self.scraper.poll_state.save()
             return len(new_properties)
             
         except Exception as e:
@@ -129,6 +105,7 @@ class ScraperTracker:
         
         # Inicializar la hoja de cálculo
         self.sheets.get_or_create_spreadsheet()
+        self.sheets_queue.start()
         
         try:
             while True:
@@ -143,7 +120,7 @@ class ScraperTracker:
         except KeyboardInterrupt:
             print("\n\n🛑 Tracker detenido por el usuario")
             print(f"📊 Propiedades rastreadas: {len(self.seen_properties)}")
-            self._save_seen_properties()
+            self.sheets_queue.close()
     
     def run_once(self):
         """Ejecuta una sola búsqueda"""
@@ -161,9 +138,11 @@ class ScraperTracker:
         
         # Inicializar la hoja de cálculo
         self.sheets.get_or_create_spreadsheet()
+        self.sheets_queue.start()
         
         # Realizar una búsqueda
         new_count = self.check_new_properties()
+        self.sheets_queue.close()
         
         print(f"\n✅ Scraping completado. {new_count} nueva(s) propiedad(es)")
         return new_count
@@ -35,6 +35,9 @@ def scrape_urls_from_file(filename):
         print("❌ No se encontraron URLs válidas en el archivo")
         return
     
+    # URLs repetidas en el archivo: se scrapean una sola vez
+    urls = list(dict.fromkeys(urls))
+    
     print(f"📋 Se encontraron {len(urls)} URLs para scrapear\n")
     
     # Inicializar scraper y Google Sheets
@@ -45,41 +48,35 @@ def scrape_urls_from_file(filename):
     print(f"📊 Google Sheets: {sheets.get_spreadsheet_url()}\n")
     print("="*60)
     
-    # Scrapear cada URL
-    success_count = 0
+    # Scrapear todas las URLs en paralelo (con límite de peticiones por dominio)
+    results = scraper.scrape_property_urls(urls)
+    
     failed_count = 0
+    to_add = []
+    added_ids = set()
     
-    for i, url in enumerate(urls, 1):
-        print(f"\n[{i}/{len(urls)}] Procesando...")
+    for i, (url, property_data) in enumerate(zip(urls, results), 1):
+        print(f"\n[{i}/{len(urls)}] Procesando {url}")
         
-        try:
-            # Scrapear la propiedad
-            property_data = scraper.scrape_property_url(url)
-            
-            if property_data:
-                # Verificar si ya existe
-                property_id = property_data['id']
-                if sheets.property_exists(property_id):
-                    print(f"⚠️  La propiedad {property_id} ya existe en la hoja")
-                else:
-                    # Añadir a Google Sheets
-                    if sheets.add_property(property_data):
-                        success_count += 1
-                        print(f"✅ Añadida: {property_data['titulo'][:50]}...")
-                        print(f"   💰 {property_data['precio']:,.0f}€ | 📏 {property_data['tamaño']}m²")
-                    else:
-                        failed_count += 1
-            else:
-                failed_count += 1
-            
-            # Delay entre peticiones para ser respetuoso con el servidor
-            if i < len(urls):
-                print("⏳ Esperando 2 segundos...")
-                scraper.delay_between_requests(2)
-            
-        except Exception as e:
-            print(f"❌ Error procesando URL: {e}")
+        if not property_data:
             failed_count += 1
+            continue
+        
+        # Verificar si ya existe (en la hoja o antes en este mismo lote)
+        property_id = property_data['id']
+        if str(property_id) in added_ids:
+            print(f"⚠️  La propiedad {property_id} está repetida en el archivo")
+        elif sheets.property_exists(property_id):
+            print(f"⚠️  La propiedad {property_id} ya existe en la hoja")
+        else:
+            added_ids.add(str(property_id))
+            to_add.append(property_data)
+            print(f"➕ {property_data['titulo'][:50]}...")
+            print(f"   💰 {property_data['precio']:,.0f}€ | 📏 {property_data['tamaño']}m²")
+    
+    # Añadir todas a Google Sheets de una vez
+    success_count = sheets.add_properties(to_add)
+    failed_count += len(to_add) - success_count
     
     # Resumen
     print("\n" + "="*60)
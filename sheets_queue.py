@@ -0,0 +1,309 @@
+"""
+Cola de escritura diferida (write-behind) para Google Sheets
+Los trackers encolan filas y cambios de estado y siguen trabajando; un hilo
+en segundo plano los escribe en bloques cada cierto tiempo o al llegar a un
+tamaño, sin pasarse de la cuota de escrituras por minuto y con backoff ante
+429 o errores. La cola vive en SQLite, así que lo pendiente sobrevive a un
+reinicio y se escribe en el siguiente arranque.
+
+Varios procesos pueden compartir el fichero: cada escritor reclama su bloque
+(BEGIN IMMEDIATE) antes de enviarlo y solo borra lo que ha reclamado; si
+falla, lo devuelve a la cola. Lo reclamado por un proceso que muere vuelve
+a estar disponible pasados CLAIM_TIMEOUT segundos.
+
+Un cambio de estado de un ID que todavía no está en la hoja (su fila la
+escribe otro proceso, o aún no se ha escrito) se queda en la cola y se
+reintenta en la siguiente escritura; pasados STATUS_MAX_AGE segundos se
+descarta avisando.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+import config
+from rate_control import RetryPolicy, TokenBucket, parse_retry_after
+
+
+KIND_ROW = 'row'
+KIND_STATUS = 'status'
+CLAIM_TIMEOUT = 600
+STATUS_MAX_AGE = 86400
+
+# Una fila repetida se queda con el último contenido. Un estado repetido
+# además vuelve a la cola aunque esté reclamado: el nuevo se escribe después
+UPSERT_ROW = '''INSERT INTO pending (kind, id, payload, queued_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (kind, id) DO UPDATE SET payload = excluded.payload'''
+UPSERT_STATUS = '''INSERT INTO pending (kind, id, payload, queued_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (kind, id) DO UPDATE SET payload = excluded.payload, claimed_by = NULL, claimed_at = NULL'''
+
+
+class SheetsWriteQueue:
+    """Buffer persistente de escrituras a GoogleSheetsManager"""
+
+    def __init__(self, sheets, path=None, flush_interval=None, batch_size=None, writes_per_minute=None):
+        """
+        Args:
+            sheets: GoogleSheetsManager con la hoja ya abierta
+            path: Fichero SQLite de la cola (default: config.SHEETS_QUEUE_FILE)
+            flush_interval: Segundos entre escrituras (default: config.SHEETS_FLUSH_INTERVAL_SECONDS)
+            batch_size: Pendientes que fuerzan una escritura inmediata (default: config.SHEETS_FLUSH_BATCH_SIZE)
+            writes_per_minute: Llamadas de escritura por minuto (default: config.SHEETS_WRITES_PER_MINUTE)
+        """
+        self.sheets = sheets
+        self.path = path or config.SHEETS_QUEUE_FILE
+        self.flush_interval = flush_interval or config.SHEETS_FLUSH_INTERVAL_SECONDS
+        self.batch_size = batch_size or config.SHEETS_FLUSH_BATCH_SIZE
+        writes_per_minute = writes_per_minute or config.SHEETS_WRITES_PER_MINUTE
+        self.bucket = TokenBucket(writes_per_minute / 60, capacity=max(1, writes_per_minute // 10))
+        self.retry_policy = RetryPolicy(base_delay=5, max_delay=300)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._failures = 0
+        self._retry_at = 0.0
+        # Marca de los bloques reclamados por esta cola
+        self._token = uuid.uuid4().hex
+
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS pending (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                queued_at REAL NOT NULL,
+                PRIMARY KEY (kind, id)
+            )
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(pending)')}
+        if 'claimed_by' not in columns:
+            self._conn.execute('ALTER TABLE pending ADD COLUMN claimed_by TEXT')
+            self._conn.execute('ALTER TABLE pending ADD COLUMN claimed_at REAL')
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def __contains__(self, property_id):
+        """¿Hay una fila pendiente de escribir para este ID?"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM pending WHERE kind = ? AND id = ?', (KIND_ROW, str(property_id))
+            ).fetchone()
+        return row is not None
+
+    def _enqueue(self, kind, items):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    UPSERT_ROW if kind == KIND_ROW else UPSERT_STATUS,
+                    [(kind, str(pid), json.dumps(payload, ensure_ascii=False, default=str), time.time())
+                     for pid, payload in items],
+                )
+                pending = self._conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        if pending >= self.batch_size:
+            with self._wakeup:
+                self._wakeup.notify()
+
+    def enqueue_properties(self, properties):
+        """Encola filas nuevas (no bloquea)"""
+        self._enqueue(KIND_ROW, [(p.get('id', ''), p) for p in properties])
+
+    def enqueue_statuses(self, statuses):
+        """Encola cambios de estado {id: estado} (no bloquea)"""
+        self._enqueue(KIND_STATUS, list(statuses.items()))
+
+    def _claim(self, kind, limit, skip=()):
+        """
+        Reclama hasta `limit` pendientes libres (o con la reclamación caducada)
+        para esta cola, salvo los IDs de `skip`. Devuelve [(id, payload, reclamado antes)]
+        """
+        now = time.time()
+        skip = list(skip)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    f'''SELECT id, payload, claimed_by IS NOT NULL FROM pending
+                        WHERE kind = ? AND (claimed_by IS NULL OR claimed_at < ?)
+                        AND id NOT IN ({','.join('?' * len(skip))})
+                        ORDER BY queued_at LIMIT ?''',
+                    (kind, now - CLAIM_TIMEOUT, *skip, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    'UPDATE pending SET claimed_by = ?, claimed_at = ? WHERE kind = ? AND id = ?',
+                    [(self._token, now, kind, pid) for pid, _, _ in rows],
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return rows
+
+    def _remove(self, kind, ids):
+        """Borra lo escrito (solo si sigue reclamado por esta cola)"""
+        with self._lock:
+            self._conn.executemany(
+                'DELETE FROM pending WHERE kind = ? AND id = ? AND claimed_by = ?',
+                [(kind, pid, self._token) for pid in ids],
+            )
+
+    def _release(self, kind, ids):
+        """Devuelve a la cola lo reclamado que no se ha podido escribir"""
+        with self._lock:
+            self._conn.executemany(
+                'UPDATE pending SET claimed_by = NULL, claimed_at = NULL WHERE kind = ? AND id = ? AND claimed_by = ?',
+                [(kind, pid, self._token) for pid in ids],
+            )
+
+    def _defer(self, kind, ids):
+        """
+        Devuelve a la cola lo que todavía no se puede escribir, salvo lo que
+        lleva más de STATUS_MAX_AGE segundos esperando, que se borra.
+        Devuelve los IDs borrados.
+        """
+        cutoff = time.time() - STATUS_MAX_AGE
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                expired = [pid for pid in ids if self._conn.execute(
+                    'SELECT 1 FROM pending WHERE kind = ? AND id = ? AND claimed_by = ? AND queued_at < ?',
+                    (kind, pid, self._token, cutoff),
+                ).fetchone()]
+                self._conn.executemany(
+                    'DELETE FROM pending WHERE kind = ? AND id = ? AND claimed_by = ?',
+                    [(kind, pid, self._token) for pid in expired],
+                )
+                self._conn.executemany(
+                    'UPDATE pending SET claimed_by = NULL, claimed_at = NULL WHERE kind = ? AND id = ? AND claimed_by = ?',
+                    [(kind, pid, self._token) for pid in ids],
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return expired
+
+    def flush(self):
+        """
+        Escribe todo lo pendiente en bloques (filas primero, después estados).
+        Devuelve False si la API ha fallado; lo no escrito sigue en la cola.
+        """
+        chunk_size = config.SHEETS_APPEND_CHUNK_SIZE
+        deferred = []
+        for kind in (KIND_ROW, KIND_STATUS):
+            while True:
+                batch = self._claim(kind, chunk_size, skip=deferred)
+                if not batch:
+                    break
+
+                payloads = {pid: json.loads(payload) for pid, payload, _ in batch}
+                try:
+                    if kind == KIND_ROW:
+                        # Reclamadas antes por un proceso que murió: puede que llegara a
+                        # escribirlas, se comprueban contra la hoja recién leída
+                        if any(reclaimed for _, _, reclaimed in batch):
+                            self.sheets.refresh_row_index()
+                        # Si la hoja no se puede leer, el bloque vuelve a la cola
+                        # en lugar de escribirse con posibles duplicados
+                        rows = [p for pid, p in payloads.items()
+                                if not self.sheets.property_exists(pid, raise_errors=True)]
+                        if rows:
+                            self.bucket.acquire()
+                            self.sheets.add_properties(rows, raise_errors=True)
+                        written = list(payloads)
+                    else:
+                        self.bucket.acquire()
+                        self.sheets.update_statuses(payloads, raise_errors=True)
+                        # update_statuses ya ha releído la hoja si faltaba alguno
+                        written = [pid for pid in payloads if self.sheets.property_exists(pid, raise_errors=True)]
+                except Exception as e:
+                    self._release(kind, list(payloads))
+                    self._on_error(e)
+                    return False
+
+                self._failures = 0
+                self._remove(kind, written)
+                missing = [pid for pid in payloads if pid not in written]
+                if missing:
+                    deferred += missing
+                    expired = self._defer(kind, missing)
+                    if expired:
+                        print(f"🗑️  Sheets: {len(expired)} estado(s) descartado(s), sus propiedades siguen "
+                              f"sin estar en la hoja tras {STATUS_MAX_AGE // 3600}h: {', '.join(expired[:5])}")
+                    if len(missing) > len(expired):
+                        print(f"⏳ Sheets: {len(missing) - len(expired)} estado(s) de propiedades que aún "
+                              f"no están en la hoja, se reintentarán")
+                if written:
+                    print(f"📤 Sheets: {len(written)} {'fila(s) escrita(s)' if kind == KIND_ROW else 'estado(s) escrito(s)'}")
+        return True
+
+    def _on_error(self, error):
+        """Backoff tras un error: Retry-After si viene, si no crece con cada fallo"""
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None)
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+
+        delay = retry_after if retry_after is not None else self.retry_policy.delay(self._failures)
+        self._failures += 1
+        self._retry_at = time.monotonic() + delay
+
+        reason = 'cuota excedida (429)' if status == 429 else str(error)
+        try:
+            pending = len(self)
+        except sqlite3.Error:
+            # El propio fichero de la cola puede ser lo que falla
+            pending = '?'
+        print(f"⏳ Sheets: {reason}. {pending} escritura(s) pendientes, reintento en {delay:.0f}s")
+
+    def _safe_flush(self):
+        """flush() del hilo: un error inesperado (p. ej. SQLite bloqueado) no lo para"""
+        try:
+            self.flush()
+        except Exception as e:
+            self._on_error(e)
+
+    def _run(self):
+        # Lo pendiente de una ejecución anterior se escribe al arrancar
+        self._safe_flush()
+        while True:
+            with self._wakeup:
+                if not self._stopping:
+                    self._wakeup.wait(timeout=self.flush_interval)
+                stopping = self._stopping
+
+            if time.monotonic() >= self._retry_at:
+                self._safe_flush()
+            if stopping:
+                return
+
+    def start(self):
+        """Arranca el hilo de escritura (lo pendiente de otra ejecución se escribe ya)"""
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='sheets-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout=30):
+        """Intenta escribir lo pendiente y para el hilo (lo que falle queda en disco)"""
+        if self._thread is not None:
+            with self._wakeup:
+                self._stopping = True
+                self._wakeup.notify()
+            self._thread.join(timeout)
+            self._thread = None
+        pending = len(self)
+        if pending:
+            print(f"💾 {pending} escritura(s) a Sheets guardadas para la próxima ejecución")
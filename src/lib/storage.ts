@@ -1,6 +1,47 @@
 import { ref, uploadBytes, getDownloadURL } from 'firebase/storage';
 import { storage } from './firebase';
 
+const isStoredPhoto = (photo: string) =>
+  photo.startsWith('data:') ||
+  photo.includes('firebasestorage') ||
+  photo.includes('googleapis.com');
+
+/**
+ * Pide al servidor que descargue las fotos y las guarde en su almacén.
+ * Los bytes no pasan por el navegador. Devuelve un mapa URL original → URL guardada.
+ */
+async function persistPhotosOnServer(photos: string[]): Promise<Map<string, string>> {
+  const stored = new Map<string, string>();
+  const external = photos.filter((photo) => !isStoredPhoto(photo));
+  if (external.length === 0) return stored;
+
+  // /api/persist-photos solo existe en el servidor Flask (Vercel no lo sirve):
+  // en producción hace falta VITE_API_URL apuntando a él
+  const base = import.meta.env.DEV ? 'http://localhost:5001' : import.meta.env.VITE_API_URL;
+  if (!base) {
+    console.warn('VITE_API_URL not set, uploading photos from the browser');
+    return stored;
+  }
+
+  try {
+    const response = await fetch(`${base.replace(/\/$/, '')}/api/persist-photos`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ urls: external }),
+    });
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+    const data: { photos: { url: string; storedUrl?: string }[] } = await response.json();
+    for (const photo of data.photos) {
+      if (photo.storedUrl) stored.set(photo.url, photo.storedUrl);
+    }
+  } catch (error) {
+    console.warn('Server photo persistence failed, falling back to browser upload:', error);
+  }
+
+  return stored;
+}
+
 /**
  * Descarga fotos externas a través del proxy y las sube a Firebase Storage.
  * Devuelve un array de URLs de Firebase Storage.
@@ -15,20 +56,30 @@ export async function uploadPropertyPhotos(
 ): Promise<string[]> {
   const results: string[] = [];
 
+  // Con almacén en el servidor, solo se suben desde el navegador las que fallen
+  const serverStored =
+    import.meta.env.VITE_SERVER_PHOTO_STORE === 'true'
+      ? await persistPhotosOnServer(photos)
+      : new Map<string, string>();
+
   for (let i = 0; i < photos.length; i++) {
     const photo = photos[i];
 
     // Ya es Firebase Storage o data: → skip
-    if (
-      photo.startsWith('data:') ||
-      photo.includes('firebasestorage') ||
-      photo.includes('googleapis.com')
-    ) {
+    if (isStoredPhoto(photo)) {
       results.push(photo);
       onProgress?.(i + 1, photos.length);
       continue;
     }
 
+    // Ya guardada por el servidor
+    const storedUrl = serverStored.get(photo);
+    if (storedUrl) {
+      results.push(storedUrl);
+      onProgress?.(i + 1, photos.length);
+      continue;
+    }
+
     try {
       // Descargar via proxy
       const base = import.meta.env.DEV ? 'http://localhost:5001' : '';
@@ -0,0 +1,79 @@
+import json
+import os
+
+from http_client import FetchEngine, PollStateStore
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeEngine(FetchEngine):
+    """FetchEngine que responde con una lista fija en lugar de ir a la red"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, **kwargs):
+        self.sent_headers.append(kwargs.get('headers', {}))
+        return self.responses.pop(0)
+
+
+def test_transaction_changes_are_invisible_until_commit(tmp_path):
+    store = PollStateStore(str(tmp_path / 'poll_state.json'))
+    poll = store.begin()
+
+    assert poll.is_unchanged('busqueda', 'hash-1') is False
+    poll.set_cursor('busqueda', {'page': 2})
+    assert poll.is_unchanged('busqueda', 'hash-1') is True
+    assert poll.get_cursor('busqueda') == {'page': 2}
+    assert store.get_cursor('busqueda') is None
+
+    poll.commit()
+    assert store.get_cursor('busqueda') == {'page': 2}
+    assert store.is_unchanged('busqueda', 'hash-1') is True
+
+
+def test_discarded_transaction_leaves_state_untouched(tmp_path):
+    store = PollStateStore(str(tmp_path / 'poll_state.json'))
+    committed = store.begin()
+    committed.is_unchanged('busqueda', 'hash-1')
+    committed.commit()
+
+    failed = store.begin()
+    assert failed.is_unchanged('busqueda', 'hash-2') is False
+    # Sin commit(): el siguiente ciclo vuelve a ver el hash anterior
+    assert store.begin().is_unchanged('busqueda', 'hash-2') is False
+
+
+def test_save_is_atomic_and_reloads(tmp_path):
+    path = str(tmp_path / 'poll_state.json')
+    store = PollStateStore(path)
+    store.set_cursor('busqueda', 'abc')
+    store.save()
+
+    assert os.listdir(tmp_path) == ['poll_state.json']
+    assert json.load(open(path))['busqueda']['cursor'] == 'abc'
+    assert PollStateStore(path).get_cursor('busqueda') == 'abc'
+
+
+def test_validators_are_only_stored_from_successful_responses(tmp_path):
+    store = PollStateStore(str(tmp_path / 'poll_state.json'))
+    url = 'https://example.com/busqueda'
+    engine = FakeEngine([
+        FakeResponse(500, {'ETag': '"error"'}),
+        FakeResponse(200, {'ETag': '"v1"'}),
+        FakeResponse(304),
+    ])
+
+    poll = store.begin()
+    assert engine.get_if_modified(url, poll).status_code == 500
+    assert poll.conditional_headers(url) == {}
+
+    assert engine.get_if_modified(url, poll).status_code == 200
+    poll.commit()
+    assert engine.get_if_modified(url, store.begin()) is None
+    assert engine.sent_headers[-1] == {'If-None-Match': '"v1"'}
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from property_store import PropertyStore, price_drops
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PropertyStore(path=str(tmp_path / 'properties.db'),
+                         migrate_from=str(tmp_path / 'no_existe.json'), ttl_days=0)
+
+
+def test_add_new_returns_only_unseen_ids_in_order(store):
+    assert store.add_new(['3', '1', '3', None, '2']) == ['3', '1', '2']
+    assert store.add_new([1, '4', 2]) == ['4']
+    assert '1' in store and 4 in store and '5' not in store
+    assert len(store) == 4
+
+
+def test_seen_ids_are_visible_to_other_connections(store, tmp_path):
+    other = PropertyStore(path=store.path, migrate_from=str(tmp_path / 'no_existe.json'), ttl_days=0)
+    store.add_new(['10'])
+    assert '10' in other
+    assert other.add_new(['10', '11']) == ['11']
+
+
+def test_ttl_makes_old_ids_new_again(tmp_path):
+    store = PropertyStore(path=str(tmp_path / 'properties.db'),
+                          migrate_from=str(tmp_path / 'no_existe.json'), ttl_days=1)
+    store.add_new(['1', '2'])
+    store._conn.execute('UPDATE properties SET last_seen = ? WHERE id = ?', (time.time() - 2 * 86400, '1'))
+
+    assert '1' not in store and '2' in store
+    assert store.add_new(['1', '2']) == ['1']
+
+
+def test_migrates_json_once(tmp_path):
+    legacy = tmp_path / 'seen_properties.json'
+    legacy.write_text('{"seen_ids": ["a", "b"]}')
+    store = PropertyStore(path=str(tmp_path / 'properties.db'), migrate_from=str(legacy), ttl_days=0)
+
+    assert 'a' in store and 'b' in store
+    assert not legacy.exists()
+    assert (tmp_path / 'seen_properties.json.migrated').exists()
+
+
+def test_track_changes_records_only_real_changes(store):
+    first = {'id': '1', 'precio': 300000, 'tamaño': 80, 'titulo': 'Piso'}
+    assert store.track_changes([first]) == []
+    assert store.track_changes([dict(first, titulo='Otro título')]) == []
+
+    # Un campo de relleno no borra el valor guardado
+    cheaper = {'id': '1', 'precio': 280000, 'tamaño': 0}
+    changes = store.track_changes([cheaper])
+    assert changes == [(cheaper, {'precio': (300000, 280000)})]
+    assert price_drops(changes) == [(cheaper, 300000, 280000)]
+
+    assert store.track_changes([{'id': '1', 'precio': 280000, 'tamaño': 80}]) == []
+    assert [(old, new) for _, old, new in store.price_history('1')] == [(300000, 280000)]
@@ -0,0 +1,163 @@
+import time
+
+import pytest
+
+import sheets_queue
+from sheets_queue import KIND_ROW, SheetsWriteQueue
+
+
+class FakeSheets:
+    """GoogleSheetsManager en memoria: filas por ID y estados escritos"""
+
+    def __init__(self):
+        self.rows = {}
+        self.statuses = {}
+        self.appends = 0
+        self.fail_next = None
+        self.fail_reads = False
+
+    def _maybe_fail(self):
+        if self.fail_next:
+            error, self.fail_next = self.fail_next, None
+            raise error
+
+    def refresh_row_index(self):
+        return len(self.rows)
+
+    def property_exists(self, property_id, raise_errors=False):
+        if self.fail_reads:
+            if raise_errors:
+                raise RuntimeError('lectura fallida')
+            return False
+        return str(property_id) in self.rows
+
+    def add_properties(self, properties, raise_errors=False):
+        self._maybe_fail()
+        self.appends += 1
+        for prop in properties:
+            assert str(prop['id']) not in self.rows, 'fila duplicada'
+            self.rows[str(prop['id'])] = prop
+        return len(properties)
+
+    def update_statuses(self, statuses, raise_errors=False):
+        self._maybe_fail()
+        found = {pid: status for pid, status in statuses.items() if pid in self.rows}
+        self.statuses.update(found)
+        return len(found)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__('429')
+        self.response = type('Response', (), {'status_code': 429, 'headers': {'Retry-After': retry_after}})()
+
+
+@pytest.fixture
+def sheets():
+    return FakeSheets()
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(sheets):
+        return SheetsWriteQueue(sheets, path=str(tmp_path / 'queue.db'), writes_per_minute=6000)
+    return make
+
+
+def test_flush_writes_rows_then_statuses(sheets, make_queue):
+    queue = make_queue(sheets)
+    queue.enqueue_properties([{'id': '1'}, {'id': '2'}])
+    queue.enqueue_statuses({'1': 'Visitado'})
+    assert '1' in queue and len(queue) == 3
+
+    assert queue.flush() is True
+    assert set(sheets.rows) == {'1', '2'}
+    assert sheets.statuses == {'1': 'Visitado'}
+    assert len(queue) == 0
+
+
+def test_claimed_rows_are_not_claimed_by_another_queue(sheets, make_queue):
+    first, second = make_queue(sheets), make_queue(sheets)
+    first.enqueue_properties([{'id': str(i)} for i in range(10)])
+
+    claimed = first._claim(KIND_ROW, 100)
+    assert len(claimed) == 10
+    assert second._claim(KIND_ROW, 100) == []
+
+    first._release(KIND_ROW, [pid for pid, _, _ in claimed])
+    assert len(second._claim(KIND_ROW, 100)) == 10
+
+
+def test_stale_claims_are_reclaimed(sheets, make_queue, monkeypatch):
+    crashed, survivor = make_queue(sheets), make_queue(sheets)
+    crashed.enqueue_properties([{'id': '1'}])
+    crashed._claim(KIND_ROW, 100)
+
+    monkeypatch.setattr(sheets_queue, 'CLAIM_TIMEOUT', -1)
+    assert survivor._claim(KIND_ROW, 100) == [('1', '{"id": "1"}', 1)]
+
+
+def test_api_error_releases_batch_and_backs_off(sheets, make_queue):
+    queue = make_queue(sheets)
+    queue.enqueue_properties([{'id': '1'}])
+    sheets.fail_next = RateLimited('7')
+
+    assert queue.flush() is False
+    assert len(queue) == 1 and sheets.rows == {}
+    assert queue._retry_at - time.monotonic() == pytest.approx(7, abs=1)
+
+    # El reintento escribe la fila una sola vez
+    assert queue.flush() is True
+    assert list(sheets.rows) == ['1'] and len(queue) == 0
+
+
+def test_failed_index_read_keeps_rows_queued(sheets, make_queue):
+    queue = make_queue(sheets)
+    queue.enqueue_properties([{'id': '1'}])
+    sheets.fail_reads = True
+
+    assert queue.flush() is False
+    assert sheets.appends == 0 and len(queue) == 1
+
+
+def test_status_for_unknown_row_stays_queued(sheets, make_queue, monkeypatch):
+    queue = make_queue(sheets)
+    queue.enqueue_statuses({'9': 'Descartado'})
+
+    assert queue.flush() is True
+    assert sheets.statuses == {} and len(queue) == 1
+
+    sheets.rows['9'] = {'id': '9'}
+    assert queue.flush() is True
+    assert sheets.statuses == {'9': 'Descartado'} and len(queue) == 0
+
+    queue.enqueue_statuses({'10': 'Descartado'})
+    monkeypatch.setattr(sheets_queue, 'STATUS_MAX_AGE', -1)
+    assert queue.flush() is True
+    assert len(queue) == 0
+
+
+def test_writer_thread_survives_unexpected_errors(sheets, make_queue):
+    queue = make_queue(sheets)
+    queue.flush_interval = 0.05
+    queue.retry_policy.base_delay = 0.05
+
+    calls = []
+    claim = queue._claim
+
+    def flaky_claim(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        return claim(*args, **kwargs)
+
+    queue._claim = flaky_claim
+    queue.start()
+    queue.enqueue_properties([{'id': '1'}])
+    deadline = time.monotonic() + 5
+    while len(queue) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert queue._thread.is_alive()
+    queue.close()
+    assert list(sheets.rows) == ['1']
@@ -0,0 +1,98 @@
+"""
+Almacén de tokens OAuth compartido entre procesos
+El token se guarda en un fichero JSON (permisos 0600) y se renueva antes de
+caducar. Un lock de fichero (fcntl) garantiza que solo un proceso a la vez
+pide un token nuevo; los demás esperan y leen el que este ha guardado.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    # Windows: sin lock entre procesos, solo dentro del proceso
+    HAS_FCNTL = False
+
+
+class TokenStore:
+    """Tokens por clave (p. ej. hash de la API key) con su hora de caducidad"""
+
+    def __init__(self, path, refresh_margin=300):
+        """
+        Args:
+            path: Fichero JSON donde se guardan los tokens
+            refresh_margin: Segundos antes de caducar en que el token se renueva
+        """
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.refresh_margin = refresh_margin
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if not HAS_FCNTL:
+                yield
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, tokens):
+        # Escritura atómica: los lectores nunca ven un fichero a medias
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(tokens, f)
+        os.replace(tmp_path, self.path)
+
+    def _valid(self, entry):
+        return bool(entry) and entry.get('expires_at', 0) - self.refresh_margin > time.time()
+
+    def get(self, key, fetch):
+        """
+        Devuelve un token válido para `key`. Si no hay o está a punto de
+        caducar, llama a `fetch()` → (token, segundos de validez) con el
+        lock tomado y lo guarda para el resto de procesos.
+        """
+        entry = self._read().get(key)
+        if self._valid(entry):
+            return entry['token'], entry['expires_at']
+
+        with self._locked():
+            # Otro proceso puede haberlo renovado mientras esperábamos el lock
+            tokens = self._read()
+            entry = tokens.get(key)
+            if self._valid(entry):
+                return entry['token'], entry['expires_at']
+
+            token, expires_in = fetch()
+            expires_at = time.time() + expires_in
+            tokens[key] = {'token': token, 'expires_at': expires_at}
+            try:
+                self._write(tokens)
+            except OSError as e:
+                print(f"⚠️  No se pudo guardar el token: {e}")
+            return token, expires_at
+
+    def invalidate(self, key):
+        """Descarta el token guardado (p. ej. tras un 401)"""
+        with self._locked():
+            tokens = self._read()
+            if tokens.pop(key, None) is not None:
+                self._write(tokens)
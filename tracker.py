@@ -1,5 +1,3 @@
-import json
-import os
 import time
 from datetime import datetime
 import config
@@ -13,6 +11,9 @@ else:
     print("🔌 Usando API oficial de Idealista")
 
 from google_sheets import GoogleSheetsManager
+from http_client import PollStateStore
+from property_store import PropertyStore, price_drops
+from sheets_queue import SheetsWriteQueue
 
 
 class PropertyTracker:
@@ -21,57 +22,42 @@ class PropertyTracker:
     def __init__(self):
         self.idealista = IdealistaClient()
         self.sheets = GoogleSheetsManager()
-        self.seen_properties_file = config.SEEN_PROPERTIES_FILE
-        self.seen_properties = self._load_seen_properties()
-        
-    def _load_seen_properties(self):
-        """Carga el conjunto de propiedades ya vistas"""
-        if os.path.exists(self.seen_properties_file):
-            try:
-                with open(self.seen_properties_file, 'r') as f:
-                    data = json.load(f)
-                    return set(data.get('seen_ids', []))
-            except Exception as e:
-                print(f"⚠️  Error cargando propiedades vistas: {e}")
-                return set()
-        return set()
-    
-    def _save_seen_properties(self):
-        """Guarda el conjunto de propiedades vistas"""
-        try:
-            with open(self.seen_properties_file, 'w') as f:
-                json.dump({
-                    'seen_ids': list(self.seen_properties),
-                    'last_updated': datetime.now().isoformat()
-                }, f, indent=2)
-        except Exception as e:
-            print(f"❌ Error guardando propiedades vistas: {e}")
+        # Escrituras a Sheets en segundo plano: el tracker no espera a la API
+        self.sheets_queue = SheetsWriteQueue(self.sheets)
+        self.seen_properties = PropertyStore()
+        self.poll_state = PollStateStore()
     
     def check_new_properties(self):
         """Busca nuevas propiedades y las añade a la hoja de cálculo"""
         print(f"\n🔍 Buscando nuevas propiedades... [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]")
         
         try:
-            # Obtener propiedades de Idealista
-            properties = self.idealista.search_properties()
+            # Una vez por ciclo: la caché de RapidAPI no crece sin límite
+            if hasattr(self.idealista, 'purge_cache'):
+                self.idealista.purge_cache()
+            
+            # Obtener propiedades de Idealista (None si la búsqueda no ha cambiado).
+            # Validadores, hash y cursor nuevos solo se guardan si el ciclo termina bien
+            poll = self.poll_state.begin()
+            properties = self.idealista.search_properties_if_changed(poll)
+            if properties is None:
+                return 0
             print(f"📋 Se encontraron {len(properties)} propiedades en total")
             
-            # Filtrar propiedades nuevas
-            new_properties = []
-            for prop in properties:
-                property_id = prop.get('propertyCode', prop.get('id'))
-                if property_id and str(property_id) not in self.seen_properties:
-                    new_properties.append(prop)
-                    self.seen_properties.add(str(property_id))
+            # Filtrar propiedades nuevas (y registrar las vistas en este ciclo)
+            new_ids = set(self.seen_properties.add_new(
+                prop.get('propertyCode', prop.get('id')) for prop in properties
+            ))
+            new_properties = [
+                prop for prop in properties
+                if str(prop.get('propertyCode', prop.get('id'))) in new_ids
+            ]
             
             if new_properties:
                 print(f"🆕 ¡{len(new_properties)} nueva(s) propiedad(es) encontrada(s)!")
                 
-                # Añadir cada propiedad nueva a Google Sheets
-                added_count = 0
-                for prop in new_properties:
-                    formatted_prop = self.idealista.format_property_data(prop)
-                    
+                formatted_properties = [self.idealista.format_property_data(prop) for prop in new_properties]
+                for formatted_prop in formatted_properties:
                     # Mostrar información de la nueva propiedad
                     print(f"\n  ➕ Nueva propiedad:")
                     print(f"     ID: {formatted_prop['id']}")
@@ -80,20 +66,26 @@ class PropertyTracker:
                     print(f"     Tamaño: {formatted_prop['tamaño']}m²")
                     print(f"     Ubicación: {formatted_prop['distrito']}, {formatted_prop['municipio']}")
                     print(f"     URL: {formatted_prop['url']}")
-                    
-                    # Añadir a Google Sheets
-                    if self.sheets.add_property(formatted_prop):
-                        added_count += 1
-                        self._send_notification(formatted_prop)
                 
-                print(f"\n✅ {added_count} propiedad(es) añadida(s) a Google Sheets")
+                # Encolar para Google Sheets (se escriben en bloque en segundo plano)
+                self.sheets_queue.enqueue_properties(formatted_properties)
+                for formatted_prop in formatted_properties:
+                    self._send_notification(formatted_prop)
                 
-                # Guardar IDs vistos
-                self._save_seen_properties()
+                print(f"\n📥 {len(formatted_properties)} propiedad(es) encolada(s) para Google Sheets")
                 
             else:
                 print("ℹ️  No se encontraron propiedades nuevas")
             
+            # Cambios de precio y datos de las ya conocidas (solo las que tienen otro hash)
+            changes = self.seen_properties.track_changes(
+                self.idealista.format_property_data(prop) for prop in properties
+            )
+            for property_data, old_price, new_price in price_drops(changes):
+                self._send_price_drop_alert(property_data, old_price, new_price)
+            
+            poll.commit()
+            self.poll_state.save()
             return len(new_properties)
             
         except Exception as e:
@@ -124,30 +116,57 @@ class PropertyTracker:
         # Por ahora solo imprime, pero puedes añadir tu lógica aquí
         print(notification)
     
+    def _send_price_drop_alert(self, property_data, old_price, new_price):
+        """Avisa de una bajada de precio en una propiedad ya vista"""
+        drop = (old_price - new_price) / old_price * 100 if old_price else 0
+        notification = f"""
+        📉 ¡BAJADA DE PRECIO!
+        
+        🏠 {property_data.get('titulo', '')}
+        💰 {old_price:,.0f}€ → {new_price:,.0f}€ (-{drop:.1f}%)
+        🔗 Ver más: {property_data.get('url', '')}
+        """
+        print(notification)
+    
+    def _next_wait_seconds(self):
+        """
+        Intervalo hasta la próxima comprobación: con RapidAPI se reparte la
+        cuota restante del plan; con la API oficial, CHECK_INTERVAL_MINUTES
+        """
+        if hasattr(self.idealista, 'next_poll_interval'):
+            wait_seconds = self.idealista.next_poll_interval()
+            print(f"📉 {self.idealista.scheduler.summary()}")
+            return wait_seconds
+        return config.CHECK_INTERVAL_MINUTES * 60
+
     def run_continuous(self):
         """Ejecuta el tracker continuamente"""
         print("🚀 Iniciando tracker de propiedades de Idealista")
-        print(f"⏱️  Intervalo de comprobación: {config.CHECK_INTERVAL_MINUTES} minutos")
+        if hasattr(self.idealista, 'next_poll_interval'):
+            print("⏱️  Intervalo de comprobación: ajustado a la cuota de RapidAPI")
+        else:
+            print(f"⏱️  Intervalo de comprobación: {config.CHECK_INTERVAL_MINUTES} minutos")
         print(f"📊 Google Sheets: {self.sheets.get_spreadsheet_url()}")
         print("\n" + "="*60)
         
         # Inicializar la hoja de cálculo
         self.sheets.get_or_create_spreadsheet()
+        self.sheets_queue.start()
         
         try:
             while True:
                 self.check_new_properties()
                 
                 # Esperar hasta la próxima comprobación
-                wait_seconds = config.CHECK_INTERVAL_MINUTES * 60
-                print(f"\n⏳ Esperando {config.CHECK_INTERVAL_MINUTES} minutos hasta la próxima comprobación...")
+                wait_seconds = self._next_wait_seconds()
+                print(f"\n⏳ Esperando {wait_seconds / 60:.0f} minutos hasta la próxima comprobación...")
                 print("   (Presiona Ctrl+C para detener)")
                 time.sleep(wait_seconds)
                 
         except KeyboardInterrupt:
             print("\n\n🛑 Tracker detenido por el usuario")
             print(f"📊 Propiedades rastreadas: {len(self.seen_properties)}")
-            self._save_seen_properties()
+            self.sheets_queue.close()
     
     def run_once(self):
         """Ejecuta una sola búsqueda"""
@@ -157,9 +176,11 @@ class PropertyTracker:
         
         # Inicializar la hoja de cálculo
         self.sheets.get_or_create_spreadsheet()
+        self.sheets_queue.start()
         
         # Realizar una búsqueda
         new_count = self.check_new_properties()
+        self.sheets_queue.close()
         
         print(f"\n✅ Búsqueda completada. {new_count} nueva(s) propiedad(es)")
         return new_count
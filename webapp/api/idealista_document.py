@@ -0,0 +1,49 @@
+"""
+Documento HTML de Idealista parseado una sola vez
+Compartido por IdealistaScraper, IdealistaPlaywrightScraper y el servidor API:
+el texto completo y los nodos que consultan varios extractores se calculan
+la primera vez que se piden y se reutilizan.
+"""
+
+from functools import cached_property
+from bs4 import BeautifulSoup
+
+
+class IdealistaDocument:
+    """Página de Idealista con caché del soup, del texto y de los nodos comunes"""
+
+    def __init__(self, html, parser='lxml'):
+        self.html = html
+        self.soup = BeautifulSoup(html, parser)
+        self._selections = {}
+
+    @cached_property
+    def text(self):
+        """Texto completo de la página"""
+        return self.soup.get_text()
+
+    @cached_property
+    def text_lower(self):
+        """Texto completo de la página en minúsculas"""
+        return self.text.lower()
+
+    @cached_property
+    def feature_texts(self):
+        """Textos (en minúsculas) de la lista de características del inmueble"""
+        return [el.text.lower() for el in self.soup.find_all('span', class_='details-property-feature-text')]
+
+    @cached_property
+    def breadcrumb_items(self):
+        """Elementos <li> de la ruta de navegación (provincia > municipio > distrito...)"""
+        breadcrumb = self.soup.select_one('nav.breadcrumb-container') or self.soup.select_one('.breadcrumb')
+        return breadcrumb.find_all('li') if breadcrumb else []
+
+    def select_one(self, selector):
+        """soup.select_one con caché por selector"""
+        if selector not in self._selections:
+            self._selections[selector] = self.soup.select_one(selector)
+        return self._selections[selector]
+
+    def has_feature(self, *keywords):
+        """True si alguna característica del inmueble contiene alguna de las palabras"""
+        return any(keyword in text for text in self.feature_texts for keyword in keywords)
@@ -0,0 +1,232 @@
+"""
+Almacenamiento de fotos en el servidor
+Descarga las fotos de los portales y las guarda directamente en un almacén
+de objetos (sistema de ficheros local o S3 compatible, p. ej. MinIO),
+sin que los bytes pasen por el navegador del usuario.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+try:
+    import boto3
+    HAS_BOTO3 = True
+except ImportError:
+    HAS_BOTO3 = False
+
+
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/avif': '.avif',
+    'image/gif': '.gif',
+}
+
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+
+
+class FilesystemPhotoStore:
+    """Guarda las fotos en un directorio local"""
+
+    def __init__(self, root_dir, public_base_url=''):
+        self.root_dir = root_dir
+        self.public_base_url = public_base_url.rstrip('/')
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root_dir, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put_file(self, key, file_path, content_type):
+        """Mueve un fichero temporal a su ubicación definitiva"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(file_path, path)
+
+    def url_for(self, key):
+        """URL absoluta de la foto (requiere PHOTO_STORE_PUBLIC_URL)"""
+        if not self.public_base_url:
+            raise ValueError("Sin URL pública para las fotos: configura PHOTO_STORE_PUBLIC_URL")
+        return f"{self.public_base_url}/api/photos/{key}"
+
+
+class S3PhotoStore:
+    """Guarda las fotos en un bucket S3 (o compatible: MinIO, R2...)"""
+
+    def __init__(self, bucket, endpoint_url=None, public_base_url=''):
+        if not HAS_BOTO3:
+            raise RuntimeError("boto3 no está instalado (pip install boto3)")
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        if public_base_url:
+            self.public_base_url = public_base_url.rstrip('/')
+        elif endpoint_url:
+            self.public_base_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.public_base_url = f"https://{bucket}.s3.amazonaws.com"
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def put_file(self, key, file_path, content_type):
+        with open(file_path, 'rb') as f:
+            self.client.upload_fileobj(
+                f, self.bucket, key,
+                ExtraArgs={
+                    'ContentType': content_type,
+                    'CacheControl': 'public, max-age=31536000, immutable',
+                },
+            )
+        os.remove(file_path)
+
+    def url_for(self, key):
+        return f"{self.public_base_url}/{key}"
+
+
+def create_photo_store():
+    """Crea el almacén configurado en las variables de entorno"""
+    backend = os.environ.get('PHOTO_STORE_BACKEND', 'filesystem').lower()
+    public_base_url = os.environ.get('PHOTO_STORE_PUBLIC_URL', '')
+
+    if backend == 's3':
+        return S3PhotoStore(
+            bucket=os.environ.get('PHOTO_STORE_BUCKET', 'hogar-photos'),
+            endpoint_url=os.environ.get('PHOTO_STORE_ENDPOINT_URL') or None,
+            public_base_url=public_base_url,
+        )
+
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'photo_store')
+    return FilesystemPhotoStore(
+        root_dir=os.environ.get('PHOTO_STORE_DIR', default_dir),
+        public_base_url=public_base_url,
+    )
+
+
+class PhotoPersister:
+    """
+    Descarga fotos en streaming y las guarda en el almacén,
+    con concurrencia limitada y deduplicación por hash de contenido.
+    """
+
+    def __init__(self, store, headers_for_url, max_workers=4, timeout=15, session=None, fetch=None,
+                 is_allowed=None):
+        """
+        Args:
+            store: Almacén de objetos (FilesystemPhotoStore o S3PhotoStore)
+            headers_for_url: Función que devuelve las cabeceras para cada URL
+            max_workers: Número máximo de descargas simultáneas
+            timeout: Timeout de cada descarga en segundos
+            session: Sesión HTTP compartida (opcional)
+            fetch: Función GET a usar en lugar de session.get (p. ej. con reintentos)
+            is_allowed: Función que valida cada URL a la que redirige una descarga
+        """
+        self.store = store
+        self.headers_for_url = headers_for_url
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.fetch = fetch or self.session.get
+        self.is_allowed = is_allowed
+
+    def _open(self, url):
+        """
+        GET en streaming siguiendo las redirecciones a mano: cada salto se
+        valida con is_allowed para que un dominio permitido no pueda llevar
+        la descarga a una dirección interna
+        """
+        current = url
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self.fetch(current, headers=self.headers_for_url(current),
+                                  timeout=self.timeout, stream=True, allow_redirects=False)
+            if not response.is_redirect:
+                return response
+            location = urljoin(current, response.headers.get('location', ''))
+            response.close()
+            if self.is_allowed and not self.is_allowed(location):
+                raise ValueError(f"Redirección a un dominio no permitido: {location}")
+            current = location
+        raise ValueError(f"Demasiadas redirecciones ({MAX_REDIRECTS})")
+
+    def persist(self, url):
+        """Descarga una foto y la guarda. Devuelve un dict con la clave o el error"""
+        tmp_path = None
+        try:
+            with self._open(url) as response:
+                if response.status_code != 200:
+                    return {'url': url, 'error': f"HTTP {response.status_code}"}
+
+                content_type = response.headers.get('content-type', 'image/jpeg').split(';')[0].strip()
+                if not content_type.startswith('image/'):
+                    return {'url': url, 'error': f"Tipo de contenido no válido: {content_type}"}
+
+                # Volcar a un fichero temporal calculando el hash a la vez
+                digest = hashlib.sha256()
+                fd, tmp_path = tempfile.mkstemp(prefix='photo_', suffix='.part')
+                with os.fdopen(fd, 'wb') as tmp:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            digest.update(chunk)
+                            tmp.write(chunk)
+
+            content_hash = digest.hexdigest()
+            extension = CONTENT_TYPE_EXTENSIONS.get(content_type, '.jpg')
+            key = f"photos/{content_hash[:2]}/{content_hash}{extension}"
+
+            deduplicated = self.store.exists(key)
+            if deduplicated:
+                os.remove(tmp_path)
+            else:
+                self.store.put_file(key, tmp_path, content_type)
+            tmp_path = None
+
+            return {
+                'url': url,
+                'key': key,
+                'storedUrl': self.store.url_for(key),
+                'contentType': content_type,
+                'deduplicated': deduplicated,
+            }
+
+        except Exception as e:
+            return {'url': url, 'error': str(e)}
+
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def persist_many(self, urls):
+        """Guarda varias fotos en paralelo manteniendo el orden de entrada"""
+        # URLs repetidas se descargan una sola vez
+        unique_urls = list(dict.fromkeys(urls))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = dict(zip(unique_urls, executor.map(self.persist, unique_urls)))
+
+        return [results[url] for url in urls]
+
+
+def serve_path(store, key):
+    """Devuelve (directorio, fichero) para servir una clave del almacén local"""
+    if not isinstance(store, FilesystemPhotoStore):
+        return None
+    path = os.path.abspath(store._path(key))
+    root = os.path.abspath(store.root_dir)
+    if not path.startswith(root + os.sep):
+        return None
+    return os.path.dirname(path), os.path.basename(path)